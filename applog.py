@@ -0,0 +1,158 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+## Logging for the app.
+## Log records carry structured fields (route, drink id, upstream URL, latency...)
+## next to the message and are written as "key=value" text or as JSON lines.
+## Request threads only put records on a queue; a background listener thread does
+## the formatting and the writing, so a slow stdout never holds up a request.
+## Verbose payload logs (whole API responses) are DEBUG only, sampled and rate limited.
+## A forked worker process gets a queue and writer thread of its own.
+##
+## LOG_LEVEL                  DEBUG, INFO (default), WARNING, ...
+## LOG_FORMAT                 text (default) or json
+## LOG_PAYLOAD_SAMPLE_RATE    share of payload logs that are kept (default 0.1)
+## LOG_PAYLOAD_RATE_LIMIT     most payload logs written per second (default 1)
+
+ROOT_LOGGER = 'cafecopycat'
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+PAYLOAD_SAMPLE_RATE = float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', 0.1))
+PAYLOAD_RATE_LIMIT = float(os.environ.get('LOG_PAYLOAD_RATE_LIMIT', 1))
+MAX_TEXT_FIELD = 500
+
+_listener = None
+_queue_handler = None
+_sampler = None
+_lock = threading.Lock()
+_fork_hook = False
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, fmt='text'):
+        super().__init__()
+        self.json = fmt == 'json'
+
+    def format(self, record):
+        fields = getattr(record, 'fields', None) or {}
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds')
+        if self.json:
+            data = {'ts': timestamp, 'level': record.levelname, 'logger': record.name, 'msg': record.getMessage()}
+            data.update(fields)
+            return json.dumps(data, default=str)
+        parts = [timestamp, record.levelname, record.name, record.getMessage()]
+        for key, value in fields.items():
+            text = value if isinstance(value, str) else repr(value)
+            if len(text) > MAX_TEXT_FIELD:
+                text = text[:MAX_TEXT_FIELD] + f'...({len(text)} chars)'
+            parts.append(f'{key}={text}')
+        return ' '.join(parts)
+
+class PayloadSampler(logging.Filter):
+    ## Keeps a random sample of the records marked as payload logs, and at most
+    ## `rate` of them per second (token bucket). Other records always pass.
+    def __init__(self, sample_rate=PAYLOAD_SAMPLE_RATE, rate=PAYLOAD_RATE_LIMIT, burst=None):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.kept = 0
+        self.dropped = 0
+
+    def filter(self, record):
+        if not getattr(record, 'payload', False):
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if random.random() >= self.sample_rate or self._tokens < 1:
+                self.dropped += 1
+                return False
+            self._tokens -= 1
+            self.kept += 1
+            return True
+
+class StructuredLogger(logging.LoggerAdapter):
+    ## log.info("Upstream call", url=url, latency_ms=12.3): keyword arguments become fields.
+    RESERVED = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in self.RESERVED}
+        extra = dict(kwargs.get('extra') or {})
+        extra['fields'] = fields
+        kwargs['extra'] = extra
+        return msg, kwargs
+
+    def payload(self, msg, **fields):
+        ## A verbose DEBUG log with a whole response in its fields; sampled and rate limited.
+        if self.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, extra={'fields': fields, 'payload': True})
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(f'{ROOT_LOGGER}.{name}'))
+
+def setup_logging(level=None, fmt=None, stream=None):
+    ## Send the app's logs through a queue to a background writer. Safe to call more than once.
+    global _listener, _queue_handler, _sampler, _fork_hook
+    with _lock:
+        if _listener is not None:
+            return
+        log_queue = queue.SimpleQueue()
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(StructuredFormatter(fmt or LOG_FORMAT))
+        _sampler = PayloadSampler()
+        _queue_handler = QueueHandler(log_queue)
+        _queue_handler.addFilter(_sampler)
+
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(level or LOG_LEVEL)
+        logger.addHandler(_queue_handler)
+        logger.propagate = False
+
+        _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        if not _fork_hook and hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+            _fork_hook = True
+
+def _restart_after_fork():
+    ## The writer thread doesn't survive a fork; records queued in the child would never be written.
+    global _listener, _lock
+    _lock = threading.Lock()
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    ## Write out whatever is still queued and stop the writer thread.
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            logging.getLogger(ROOT_LOGGER).removeHandler(_queue_handler)
+            _listener.stop()
+            _listener = None
+            _queue_handler = None
+
+def stats():
+    if _sampler is None:
+        return {'payload_kept': 0, 'payload_dropped': 0}
+    return {'payload_kept': _sampler.kept, 'payload_dropped': _sampler.dropped}
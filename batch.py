@@ -0,0 +1,94 @@
+import json
+from recipe_registry import STATUSES
+
+## Parsing for the batch API: many ratings or recipes in one request.
+## The body is NDJSON (one JSON object per line, the way other systems stream their
+## exports), or a JSON array when the Content-Type is application/json. Every item is
+## checked before anything is written, so a bad line rejects the whole batch with its
+## line number and the database applies the rest in one transaction or not at all.
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+MIN_RATING = 1
+MAX_RATING = 5
+
+class BatchError(Exception):
+    def __init__(self, line, message):
+        super().__init__(f'line {line}: {message}')
+        self.line = line
+        self.message = message
+
+def check_rating(value):
+    ## Return a rating as an int from MIN_RATING to MAX_RATING, or raise ValueError.
+    ## Also used for the single ratings posted by the recipe page.
+    ## int() would take true as 1 and cut 4.7 down to 4
+    if isinstance(value, bool):
+        raise ValueError('rating must be a number')
+    try:
+        rating = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('rating must be a number')
+    if isinstance(value, float) and value != rating:
+        raise ValueError('rating must be a whole number')
+    if not MIN_RATING <= rating <= MAX_RATING:
+        raise ValueError(f'rating must be between {MIN_RATING} and {MAX_RATING}')
+    return rating
+
+def read_items(stream, mimetype):
+    ## Yield (line number, item) from an NDJSON stream, or from a JSON array.
+    if mimetype == 'application/json':
+        try:
+            items = json.load(stream)
+        except ValueError as e:
+            raise BatchError(1, f'invalid JSON: {e}')
+        if not isinstance(items, list):
+            raise BatchError(1, 'expected a JSON array')
+        yield from enumerate(items, 1)
+        return
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            raise BatchError(number, f'invalid JSON: {e}')
+
+def parse_rating(line, item):
+    ## Return (drink id, rating) of a {"idDrink": ..., "rating": 1-5} item.
+    if not isinstance(item, dict) or item.get('idDrink') in (None, ''):
+        raise BatchError(line, 'expected an object with idDrink and rating')
+    try:
+        return str(item['idDrink']), check_rating(item.get('rating'))
+    except ValueError as e:
+        raise BatchError(line, str(e))
+
+def parse_recipe(line, item, new_id):
+    ## Return (record, kind) of a recipe item: a drink record like the ones the export
+    ## writes, with an optional kind ('saved' or 'created'). Created recipes without an
+    ## idDrink get a new one from new_id().
+    if not isinstance(item, dict) or not item.get('strDrink'):
+        raise BatchError(line, 'expected a recipe object with strDrink')
+    record = dict(item)
+    kind = record.pop('kind', None) or ('created' if record.get('strCategory') == 'Created Recipes' else 'saved')
+    if kind not in STATUSES:
+        raise BatchError(line, f'kind must be one of {", ".join(STATUSES)}')
+    if record.get('idDrink') in (None, ''):
+        if kind != 'created':
+            raise BatchError(line, 'a saved recipe needs its idDrink')
+        record['idDrink'] = new_id()
+    if kind == 'created':
+        record['strCategory'] = 'Created Recipes'
+    rating = record.get('rating')
+    if rating not in (None, ''):
+        try:
+            record['rating'] = check_rating(rating)
+        except ValueError as e:
+            raise BatchError(line, str(e))
+    else:
+        record['rating'] = None
+    return record, kind
+
+def write_items(items):
+    ## Yield NDJSON lines, e.g. as the body of a streamed response.
+    for item in items:
+        yield json.dumps(item) + '\n'
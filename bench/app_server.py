@@ -0,0 +1,43 @@
+import json
+import logging
+import os
+import sys
+import time
+
+## Boots the app from main.py on a free port for the benchmark runner (run.py).
+## The runner sets the environment (API URL, database, caches) before starting this
+## process, so the app is measured in its own process, including its memory use.
+## Prints one JSON line with the port and the startup time once it is listening;
+## the catalog may still be loading then (see /ready).
+## With BENCH_WORKERS above 1 it runs the pre-fork server of serve.py instead, which
+## loads the catalog before it starts listening.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == '__main__':
+    started = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    workers = int(os.environ.get('BENCH_WORKERS', 1))
+    if workers > 1:
+        import socket
+        import serve
+
+        app = serve.load_app()
+        sock = socket.create_server(('127.0.0.1', 0), backlog=2048)
+        print(json.dumps({'port': sock.getsockname()[1], 'startup_seconds': time.perf_counter() - started}), flush=True)
+        serve.serve_prefork(app, sock, workers, int(os.environ.get('BENCH_THREADS', 8)))
+        sys.exit(0)
+
+    from werkzeug.serving import make_server
+    import main
+
+    app = main.create_app()
+    ## Werkzeug's per-request access log would be measured along with the app
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    print(json.dumps({'port': server.server_port, 'startup_seconds': time.perf_counter() - started}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
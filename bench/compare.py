@@ -0,0 +1,62 @@
+import argparse
+import json
+import sys
+
+## Compare two benchmark results from bench/run.py and flag regressions.
+## A scenario regresses when its p95 latency grows, or its throughput drops, by more
+## than the threshold; peak RSS is checked the same way per catalog size.
+## Exits with status 1 if anything regressed, so it can gate a CI job.
+##
+##   python bench/compare.py bench/results/baseline.json bench/results/current.json --threshold 0.15
+
+def load(path):
+    with open(path) as f:
+        return {run['drinks']: run for run in json.load(f)['runs']}
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before
+
+def compare(baseline, current, threshold):
+    ## Return (rows, regressions); each row is (drinks, name, metric, before, after, change).
+    rows = []
+    regressions = []
+    for drinks in sorted(set(baseline) & set(current)):
+        before_run, after_run = baseline[drinks], current[drinks]
+        checks = [('peak_rss_bytes', before_run.get('peak_rss_bytes'), after_run.get('peak_rss_bytes'), 1),
+                  ('time_to_first_request_seconds', before_run.get('time_to_first_request_seconds'),
+                   after_run.get('time_to_first_request_seconds'), 1)]
+        for name in sorted(set(before_run['scenarios']) & set(after_run['scenarios'])):
+            before, after = before_run['scenarios'][name], after_run['scenarios'][name]
+            checks.append((f'{name} p95_ms', before['latency_ms']['p95'], after['latency_ms']['p95'], 1))
+            checks.append((f'{name} rps', before['throughput_rps'], after['throughput_rps'], -1))
+        for metric, before, after, direction in checks:
+            delta = change(before, after)
+            rows.append((drinks, metric, before, after, delta))
+            if delta is not None and delta * direction > threshold:
+                regressions.append((drinks, metric, before, after, delta))
+    return rows, regressions
+
+def format_row(row):
+    drinks, metric, before, after, delta = row
+    delta_text = f'{delta:+.1%}' if delta is not None else 'n/a'
+    return f'{drinks:>7} {metric:<32} {before!s:>14} {after!s:>14} {delta_text:>8}'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative change before it counts as a regression')
+    args = parser.parse_args()
+
+    rows, regressions = compare(load(args.baseline), load(args.current), args.threshold)
+    print(f'{"drinks":>7} {"metric":<32} {"baseline":>14} {"current":>14} {"change":>8}')
+    for row in rows:
+        print(format_row(row))
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) above {args.threshold:.0%}:')
+        for row in regressions:
+            print(format_row(row))
+        sys.exit(1)
+    print('\nNo regressions.')
@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench.stub_api import StubCocktailDB
+from storage import Store
+
+## Benchmark and load test for the Flask routes.
+## For every catalog size it starts a stub of TheCocktailDB (bench/stub_api.py) with
+## the requested latency, seeds a fresh database with the same synthetic drinks, boots
+## the app from main.py in its own process (bench/app_server.py) and drives each route
+## scenario with a fixed number of requests from a pool of concurrent clients.
+## The result is one JSON document (throughput, p50/p95/p99 latency, peak RSS, PSS and
+## time to first request per run) that bench/compare.py can diff against an earlier one.
+## The first boot on a fresh database builds the catalog snapshot; --warm-start boots
+## the app once beforehand so the measured start loads the snapshot instead.
+## --workers runs the app with the pre-fork server of serve.py to measure how it scales.
+##
+##   python bench/run.py --drinks 1000 10000 --latency 50 --output bench/results/current.json
+
+CATEGORIES = ['Cocktail', 'Ordinary_Drink', 'Shot', 'Beer', 'Shake']
+UNITS = ['metric', 'imperial']
+
+def scenarios(drinks):
+    ## Scenario name -> function(rng) returning (method, path, request kwargs).
+    drink_id = lambda rng: str(10000 + rng.randrange(drinks))
+    return {
+        'home': lambda rng: ('GET', '/', {}),
+        'search_name': lambda rng: ('GET', '/search', {'params': {'query': f'Drink {rng.randrange(drinks)}'}}),
+        'search_letter': lambda rng: ('GET', '/search', {'params': {'query': 'd', 'page': rng.randint(1, 5)}}),
+        'search_ingredient': lambda rng: ('GET', '/search', {'params': {'ingredient': f'Ingredient {rng.randrange(400)}'}}),
+        'search_alcoholic': lambda rng: ('GET', '/search', {'params': {'alcoholic': rng.choice(['Alcoholic', 'Non_Alcoholic'])}}),
+        'category': lambda rng: ('GET', f'/category/{rng.choice(CATEGORIES)}', {}),
+        'recipe': lambda rng: ('GET', f'/recipe/{drink_id(rng)}', {}),
+        'recipe_unit_toggle': lambda rng: ('POST', f'/recipe/{drink_id(rng)}', {'data': {'unit': rng.choice(UNITS)}}),
+        'rate_recipe': lambda rng: ('POST', '/rate_recipe', {'json': {'idDrink': drink_id(rng), 'rating': rng.randint(1, 5)}}),
+    }
+
+def percentile(sorted_values, fraction):
+    ## Nearest-rank percentile of an already sorted list.
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    as_ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': as_ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': as_ms(percentile(latencies, 0.50)),
+            'p95': as_ms(percentile(latencies, 0.95)),
+            'p99': as_ms(percentile(latencies, 0.99)),
+            'max': as_ms(latencies[-1] if latencies else None),
+        },
+    }
+
+def drive(base_url, make_request, count, concurrency, seed):
+    ## Send `count` requests from `concurrency` clients and return the summary.
+    ## Each client has its own Session and random generator, so runs are repeatable.
+    remaining = [count]
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+
+    def client(n):
+        rng = random.Random(seed * 1000 + n)
+        session = requests.Session()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            method, path, kwargs = make_request(rng)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=60, allow_redirects=False, **kwargs)
+                ok = response.status_code < 500
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+        session.close()
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+def peak_rss_bytes(pid):
+    ## High-water mark of the resident memory of a running process (Linux), or None.
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def total_pss_bytes(pid):
+    ## Proportional set size of a process and its children (Linux), or None. Pages the
+    ## pre-fork workers share with the master are counted once, split between them.
+    def pss(pid):
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(child) for child in f.read().split()]
+        return pss(pid) + sum(pss(child) for child in children)
+    except OSError:
+        return None
+
+def seed_database(path, records):
+    ## A database that already holds the synthetic catalog, so the app skips the CSV import.
+    store = Store(path)
+    store.upsert_drinks(records, 'default')
+    store.set_meta('csv_imported', str(time.time()))
+
+def start_app(env):
+    ## Start the app and wait until it has served its first page. Returns the process and
+    ## the start-up timings: listening, ready (catalog loaded) and first request answered.
+    spawned = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bench', 'app_server.py')],
+                               env=env, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise SystemExit(f'The app failed to start (exit code {process.returncode}).')
+    started = json.loads(line)
+    base_url = f"http://127.0.0.1:{started['port']}"
+    while True:
+        response = requests.get(base_url + '/', timeout=120)
+        if response.status_code != 503:
+            break
+    first_request = time.perf_counter() - spawned
+    ready = requests.get(base_url + '/ready', timeout=10).json()
+    timings = {'port': started['port'], 'startup_seconds': round(started['startup_seconds'], 3),
+               'ready_after_seconds': ready.get('ready_after_seconds'),
+               'time_to_first_request_seconds': round(first_request, 3)}
+    return process, timings
+
+def stop_app(process):
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def run_size(drinks, args):
+    stub = StubCocktailDB(drinks, args.latency / 1000, args.jitter / 1000, seed=args.seed)
+    api_url = stub.start()
+    workdir = tempfile.mkdtemp(prefix='cafecopycat-bench-')
+    try:
+        seed_database(os.path.join(workdir, 'bench.sqlite'), stub.records)
+        env = dict(os.environ,
+                   COCKTAILDB_API_URL=api_url,
+                   DATABASE_PATH=os.path.join(workdir, 'bench.sqlite'),
+                   DETAIL_CACHE_PATH='' if not args.disk_cache else os.path.join(workdir, 'detail_cache.sqlite'),
+                   COCKTAILDB_MIRROR_PATH=os.path.join(workdir, 'mirror.sqlite') if args.mirror else '',
+                   LOG_LEVEL=args.log_level,
+                   BENCH_WORKERS=str(args.workers))
+        if args.warm_start:
+            stop_app(start_app(env)[0])
+        process, timings = start_app(env)
+        base_url = f"http://127.0.0.1:{timings['port']}"
+        print(f"  started in {timings['time_to_first_request_seconds']} s to first request", file=sys.stderr)
+        results = {}
+        try:
+            for name, make_request in scenarios(drinks).items():
+                if args.scenarios and name not in args.scenarios:
+                    continue
+                if args.warmup:
+                    drive(base_url, make_request, args.warmup, args.concurrency, args.seed + 1)
+                results[name] = drive(base_url, make_request, args.requests, args.concurrency, args.seed)
+                print(f"  {name}: {results[name]['throughput_rps']} req/s, "
+                      f"p95 {results[name]['latency_ms']['p95']} ms, errors {results[name]['errors']}", file=sys.stderr)
+            peak_rss = peak_rss_bytes(process.pid)
+            pss = total_pss_bytes(process.pid)
+        finally:
+            stop_app(process)
+        if peak_rss is None:
+            ## ru_maxrss is in kilobytes on Linux and bytes on macOS
+            peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        return {'drinks': drinks, 'workers': args.workers, 'startup_seconds': timings['startup_seconds'],
+                'ready_after_seconds': timings['ready_after_seconds'],
+                'time_to_first_request_seconds': timings['time_to_first_request_seconds'],
+                'peak_rss_bytes': peak_rss, 'pss_bytes': pss, 'upstream_requests': stub.requests, 'scenarios': results}
+    finally:
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the CafeCopyCat routes against a stub of TheCocktailDB.')
+    parser.add_argument('--drinks', type=int, nargs='+', default=[1000], help='catalog sizes to run, e.g. 1000 10000 100000')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency added to every stub API response, in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random stub latency of up to this many milliseconds')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests per scenario before measuring')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--scenarios', nargs='*', help='only run these scenarios')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--mirror', action='store_true', help='keep the API mirror on (off by default, so upstream latency shows)')
+    parser.add_argument('--disk-cache', action='store_true', help='keep the sqlite tier of the detail cache on')
+    parser.add_argument('--workers', type=int, default=1, help='run the app with this many worker processes (serve.py pre-fork server)')
+    parser.add_argument('--warm-start', action='store_true', help='boot the app once before measuring, so it starts from the catalog snapshot')
+    parser.add_argument('--log-level', default='WARNING', help='LOG_LEVEL of the app during the run')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'latency_ms': args.latency,
+            'jitter_ms': args.jitter,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+            'mirror': args.mirror,
+            'warm_start': args.warm_start,
+            'workers': args.workers,
+        },
+        'runs': [],
+    }
+    for drinks in args.drinks:
+        print(f"Running with {drinks} drinks", file=sys.stderr)
+        report['runs'].append(run_size(drinks, args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from catalog import MAX_INGREDIENTS, synthetic_records
+
+## Local stand-in for TheCocktailDB used by the benchmarks.
+## It serves list.php, filter.php, search.php and lookup.php for a synthetic catalog
+## of any size, with the same response shapes as the real API, and can add a fixed
+## latency (plus random jitter) to every response to imitate a slow upstream.
+
+FILTER_FIELDS = ('strDrink', 'strDrinkThumb', 'idDrink')
+
+class StubCocktailDB:
+    def __init__(self, drinks=1000, latency=0.0, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.records = synthetic_records(drinks, seed)
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+        self.by_id = {}
+        self.by_category = {}
+        self.by_ingredient = {}
+        self.by_alcoholic = {}
+        self.by_letter = {}
+        for record in self.records:
+            self.by_id[record['idDrink']] = record
+            self.by_category.setdefault(record['strCategory'], []).append(record)
+            self.by_alcoholic.setdefault(record['strAlcoholic'].replace(' ', '_').lower(), []).append(record)
+            self.by_letter.setdefault(record['strDrink'][0].lower(), []).append(record)
+            for i in range(1, MAX_INGREDIENTS + 1):
+                ingredient = record.get(f'strIngredient{i}')
+                if ingredient:
+                    self.by_ingredient.setdefault(ingredient.lower(), []).append(record)
+
+    def respond(self, path, query):
+        ## Return the JSON body for an API path and its query arguments.
+        endpoint = path.rsplit('/', 1)[-1]
+        arg = lambda name: (query.get(name) or [''])[0]
+        if endpoint == 'list.php':
+            return {'drinks': [{'strCategory': name} for name in sorted(self.by_category)]}
+        if endpoint == 'lookup.php':
+            record = self.by_id.get(arg('i'))
+            return {'drinks': [record] if record else None}
+        if endpoint == 'search.php':
+            if 'f' in query:
+                drinks = self.by_letter.get(arg('f').lower(), [])
+            else:
+                name = arg('s').lower()
+                drinks = [record for record in self.records if name in record['strDrink'].lower()]
+            return {'drinks': drinks or None}
+        if endpoint == 'filter.php':
+            if 'c' in query:
+                drinks = self.by_category.get(arg('c'), [])
+            elif 'i' in query:
+                drinks = self.by_ingredient.get(arg('i').lower(), [])
+            else:
+                drinks = self.by_alcoholic.get(arg('a').lower(), [])
+            return {'drinks': [{key: record[key] for key in FILTER_FIELDS} for record in drinks] or None}
+        return None
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self._lock:
+                extra = self._rng.uniform(0, self.jitter) if self.jitter else 0.0
+            time.sleep(self.latency + extra)
+
+    def start(self, host='127.0.0.1', port=0):
+        ## Serve on a background thread and return the base URL to use as COCKTAILDB_API_URL.
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                with stub._lock:
+                    stub.requests += 1
+                stub.delay()
+                body = stub.respond(url.path, parse_qs(url.query))
+                if body is None:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='stub-api', daemon=True).start()
+        return f'http://{host}:{self._server.server_port}/api/json/v1/1'
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a stub of TheCocktailDB with a synthetic catalog.')
+    parser.add_argument('--drinks', type=int, default=1000, help='number of synthetic drinks')
+    parser.add_argument('--latency', type=float, default=0.0, help='added latency per response in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency of up to this many milliseconds')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    stub = StubCocktailDB(args.drinks, args.latency / 1000, args.jitter / 1000)
+    url = stub.start(port=args.port)
+    print(f"Serving {args.drinks} drinks at {url}. Run the app with COCKTAILDB_API_URL={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
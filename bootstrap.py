@@ -0,0 +1,125 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import string
+import tempfile
+import threading
+import requests
+import applog
+import cocktail_api
+
+## Catalog bootstrap: downloads every drink from the API, one search.php?f=<letter>
+## call per letter, all letters in parallel. Each finished letter is written to a
+## checkpoint file so an interrupted run picks up where it stopped.
+## Run it from the command line with `python bootstrap.py`, or let main.py start it
+## in the background when data/default.csv is empty.
+
+LETTERS = string.ascii_lowercase
+CHECKPOINT_DIR = os.path.join('data', 'bootstrap')
+OUTPUT_PATH = os.path.join('data', 'default.csv')
+
+log = applog.get_logger('bootstrap')
+
+@contextlib.contextmanager
+def atomic_write(path):
+    ## Write to a temp file of its own next to path, then move it into place, so a crash
+    ## never leaves half a file behind and two writers never touch each other's temp file.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '-')
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def checkpoint_path(letter, checkpoint_dir=CHECKPOINT_DIR):
+    return os.path.join(checkpoint_dir, f'{letter}.json')
+
+def fetch_letter(letter):
+    ## Fetch the full drink records for one letter. Raises on failure so no checkpoint gets written.
+    return cocktail_api.get_json('search.php', params={'f': letter}).get('drinks') or []
+
+def load_checkpoint(letter, checkpoint_dir=CHECKPOINT_DIR):
+    ## Return the saved drinks for a letter, or None if the letter has not been fetched yet.
+    try:
+        with open(checkpoint_path(letter, checkpoint_dir)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_checkpoint(letter, drinks, checkpoint_dir=CHECKPOINT_DIR):
+    ## Write the checkpoint to a temp file first so a crash never leaves half a file behind.
+    path = checkpoint_path(letter, checkpoint_dir)
+    with atomic_write(path) as f:
+        json.dump(drinks, f)
+
+def bootstrap_letter(letter, checkpoint_dir=CHECKPOINT_DIR):
+    ## Fetch one letter unless it is already checkpointed. Returns None if the fetch failed.
+    drinks = load_checkpoint(letter, checkpoint_dir)
+    if drinks is not None:
+        return drinks
+    try:
+        drinks = fetch_letter(letter)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log.warning('Bootstrap failed for letter', letter=letter, error=str(e))
+        return None
+    save_checkpoint(letter, drinks, checkpoint_dir)
+    return drinks
+
+def run_bootstrap(checkpoint_dir=CHECKPOINT_DIR, output_path=OUTPUT_PATH, force=False):
+    ## Fetch all letters in parallel, then write the full drink records to output_path.
+    ## Returns the list of drink records, or None if some letters are still missing.
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    if force:
+        for letter in LETTERS:
+            if os.path.exists(checkpoint_path(letter, checkpoint_dir)):
+                os.remove(checkpoint_path(letter, checkpoint_dir))
+
+    results = cocktail_api.map_concurrent(lambda letter: bootstrap_letter(letter, checkpoint_dir), LETTERS)
+    missing = [letter for letter, drinks in zip(LETTERS, results) if drinks is None]
+    if missing:
+        log.warning('Bootstrap incomplete, run it again to resume', missing=''.join(missing))
+        return None
+
+    drinks = []
+    seen = set()
+    for drink in (drink for letter_drinks in results for drink in letter_drinks):
+        if drink['idDrink'] not in seen:
+            seen.add(drink['idDrink'])
+            drinks.append(drink)
+    write_csv(drinks, output_path)
+    log.info('Bootstrap finished', drinks=len(drinks))
+    return drinks
+
+def write_csv(drinks, path):
+    ## Write the drink records to a CSV file with one column per field seen in any record.
+    columns = list(dict.fromkeys(key for drink in drinks for key in drink))
+    with atomic_write(path) as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(drinks)
+
+def start_background_bootstrap(on_done, checkpoint_dir=CHECKPOINT_DIR, output_path=OUTPUT_PATH):
+    ## Run the bootstrap on a daemon thread and pass the finished drink records to on_done.
+    def run():
+        drinks = run_bootstrap(checkpoint_dir, output_path)
+        if drinks is not None:
+            on_done(drinks)
+    thread = threading.Thread(target=run, name='catalog-bootstrap', daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download the drink catalog into data/default.csv.')
+    parser.add_argument('--force', action='store_true', help='ignore existing checkpoints and fetch every letter again')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='where to write the catalog CSV')
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR, help='where to keep the per-letter checkpoints')
+    args = parser.parse_args()
+    applog.setup_logging()
+    if run_bootstrap(args.checkpoint_dir, args.output, force=args.force) is None:
+        raise SystemExit(1)
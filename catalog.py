@@ -0,0 +1,262 @@
+import argparse
+import json
+import random
+import sys
+import tracemalloc
+from array import array
+
+## Compact in-memory drink catalog.
+## Drinks are stored column by column: names, thumbnails and instructions in plain
+## lists, and categories, alcoholic flags, glasses, ingredients and measures as
+## integer codes in array columns pointing into one pool of interned strings.
+## Ingredients and measures of all drinks share two flat arrays with an offsets
+## array marking where each drink starts. Rows are read through DrinkRow, a small
+## __slots__ view that templates can index like a dict, so nothing copies the
+## whole catalog per request.
+
+TEXT_COLUMNS = ('idDrink', 'strDrink', 'strDrinkThumb', 'strInstructions')
+CODED_COLUMNS = ('strCategory', 'strAlcoholic', 'strGlass')
+MAX_INGREDIENTS = 15
+
+def is_missing(value):
+    return value is None or value == '' or (isinstance(value, float) and value != value)
+
+def compact_record(record):
+    ## Drop the empty fields of a drink record. Upstream records carry ~50 keys,
+    ## most of them null.
+    return {key: value for key, value in record.items() if not is_missing(value)}
+
+## Maps the field names of a drink record to the column that holds them
+FIELDS = {name: ('text', name) for name in TEXT_COLUMNS}
+FIELDS.update({name: ('coded', name) for name in CODED_COLUMNS})
+FIELDS.update({f'strIngredient{i}': ('ingredient', i - 1) for i in range(1, MAX_INGREDIENTS + 1)})
+FIELDS.update({f'strMeasure{i}': ('measure', i - 1) for i in range(1, MAX_INGREDIENTS + 1)})
+
+class DrinkRow:
+    ## Read-only view of one drink of a Catalog. Supports row['strDrink'],
+    ## row.get('strDrink'), dict(row) and row.to_dict().
+    __slots__ = ('_catalog', '_index')
+
+    def __init__(self, catalog, index):
+        self._catalog = catalog
+        self._index = index
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __repr__(self):
+        return f"DrinkRow({self.get('idDrink')!r}, {self.get('strDrink')!r})"
+
+    def get(self, key, default=None):
+        catalog = self._catalog
+        i = self._index
+        field = FIELDS.get(key)
+        if field is None:
+            extras = catalog.extras[i]
+            return extras.get(key, default) if extras else default
+        kind, column = field
+        if kind == 'text':
+            value = catalog.text[column][i]
+        elif kind == 'coded':
+            value = catalog.strings[catalog.codes[column][i]]
+        else:
+            start = catalog.ingredient_offsets[i]
+            if start + column >= catalog.ingredient_offsets[i + 1]:
+                return default
+            codes = catalog.ingredient_codes if kind == 'ingredient' else catalog.measure_codes
+            value = catalog.strings[codes[start + column]]
+        return default if value is None else value
+
+    def keys(self):
+        catalog = self._catalog
+        i = self._index
+        keys = [name for name in TEXT_COLUMNS if catalog.text[name][i] is not None]
+        keys.extend(name for name in CODED_COLUMNS if catalog.codes[name][i])
+        for n in range(catalog.ingredient_offsets[i + 1] - catalog.ingredient_offsets[i]):
+            keys.append(f'strIngredient{n + 1}')
+            keys.append(f'strMeasure{n + 1}')
+        if catalog.extras[i]:
+            keys.extend(catalog.extras[i])
+        return keys
+
+    def to_dict(self):
+        ## Materialize the row as a plain dict (only the fields that are set).
+        return {key: self.get(key) for key in self.keys()}
+
+_MISSING = object()
+
+class Catalog:
+    def __init__(self):
+        ## Code 0 is reserved for "no value"
+        self.strings = [None]
+        self._codes_by_string = {None: 0}
+        self.text = {name: [] for name in TEXT_COLUMNS}
+        self.codes = {name: array('I') for name in CODED_COLUMNS}
+        self.ingredient_offsets = array('I', [0])
+        self.ingredient_codes = array('I')
+        self.measure_codes = array('I')
+        self.extras = []
+        self._index_by_id = {}
+
+    @classmethod
+    def from_records(cls, records):
+        ## Build a catalog from drink dicts. Later duplicates of an id are skipped.
+        catalog = cls()
+        for record in records:
+            catalog.append(record)
+        return catalog
+
+    def __len__(self):
+        return len(self.extras)
+
+    def __getitem__(self, index):
+        ## Positional access; slices return a list of rows so catalogs can be paginated.
+        if isinstance(index, slice):
+            return [DrinkRow(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return DrinkRow(self, index)
+
+    def __iter__(self):
+        return (DrinkRow(self, i) for i in range(len(self)))
+
+    def __contains__(self, drink_id):
+        return str(drink_id) in self._index_by_id
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def intern(self, value):
+        ## Return the code of a string in the shared pool, adding it if needed.
+        if is_missing(value):
+            return 0
+        code = self._codes_by_string.get(value)
+        if code is None:
+            value = sys.intern(str(value))
+            code = len(self.strings)
+            self.strings.append(value)
+            self._codes_by_string[value] = code
+        return code
+
+    def append(self, record):
+        ## Add one drink record. Returns its row, or None if the id is already present.
+        drink_id = str(record['idDrink'])
+        if drink_id in self._index_by_id:
+            return None
+        index = len(self)
+        for name in TEXT_COLUMNS:
+            value = record.get(name)
+            self.text[name].append(None if is_missing(value) else str(value))
+        self.text['idDrink'][index] = drink_id
+        for name in CODED_COLUMNS:
+            self.codes[name].append(self.intern(record.get(name)))
+        for n in range(1, MAX_INGREDIENTS + 1):
+            ingredient = record.get(f'strIngredient{n}')
+            measure = record.get(f'strMeasure{n}')
+            if is_missing(ingredient) and is_missing(measure):
+                continue
+            self.ingredient_codes.append(self.intern(ingredient))
+            self.measure_codes.append(self.intern(measure))
+        self.ingredient_offsets.append(len(self.ingredient_codes))
+        extras = {key: value for key, value in record.items() if key not in FIELDS and not is_missing(value)}
+        self.extras.append(extras or None)
+        self._index_by_id[drink_id] = index
+        return DrinkRow(self, index)
+
+    def ids(self):
+        ## The drink ids in row order.
+        return self.text['idDrink']
+
+    def get(self, drink_id):
+        ## Return the row for an id, or None.
+        index = self._index_by_id.get(str(drink_id))
+        return DrinkRow(self, index) if index is not None else None
+
+    def records(self):
+        ## Yield every drink as a plain dict, e.g. to build an index or write to the database.
+        for row in self:
+            yield row.to_dict()
+
+    def sample(self, rng=random):
+        ## Return a random row, or None if the catalog is empty.
+        if not len(self):
+            return None
+        return DrinkRow(self, rng.randrange(len(self)))
+
+    def in_categories(self, categories):
+        ## Return the rows whose category is one of categories.
+        codes = {self._codes_by_string[c] for c in categories if c in self._codes_by_string}
+        column = self.codes['strCategory']
+        return [DrinkRow(self, i) for i in range(len(self)) if column[i] in codes]
+
+    def memory_usage(self):
+        ## Approximate bytes held by the catalog's columns and strings.
+        size = sum(sys.getsizeof(s) for s in self.strings)
+        for column in self.text.values():
+            size += sys.getsizeof(column) + sum(sys.getsizeof(v) for v in column if v is not None)
+        for column in self.codes.values():
+            size += sys.getsizeof(column)
+        size += sys.getsizeof(self.ingredient_offsets) + sys.getsizeof(self.ingredient_codes) + sys.getsizeof(self.measure_codes)
+        size += sys.getsizeof(self.extras) + sum(sys.getsizeof(e) for e in self.extras if e)
+        size += sys.getsizeof(self._index_by_id)
+        return size
+
+def synthetic_records(count, seed=0):
+    ## Upstream-shaped drink records (all ~50 keys present, most of them null) for measurements.
+    rng = random.Random(seed)
+    categories = ['Cocktail', 'Ordinary Drink', 'Shot', 'Punch / Party Drink', 'Beer', 'Coffee / Tea', 'Shake', 'Other / Unknown']
+    ingredients = [f'Ingredient {n}' for n in range(400)]
+    measures = ['1 oz', '1 1/2 oz', '2 cl', '1 tsp', '1 dash', '1/2 cup', 'Top', '3 parts']
+    records = []
+    for n in range(count):
+        record = {
+            'idDrink': str(10000 + n), 'strDrink': f'Drink {n}', 'strDrinkAlternate': None, 'strTags': None,
+            'strVideo': None, 'strCategory': rng.choice(categories), 'strIBA': None,
+            'strAlcoholic': rng.choice(['Alcoholic', 'Non alcoholic']), 'strGlass': 'Cocktail glass',
+            'strInstructions': 'Shake with ice and strain into a chilled glass. ' * 3,
+            'strInstructionsES': None, 'strInstructionsDE': None, 'strInstructionsFR': None, 'strInstructionsIT': None,
+            'strDrinkThumb': f'https://www.thecocktaildb.com/images/media/drink/{n}.jpg',
+            'strImageSource': None, 'strImageAttribution': None, 'strCreativeCommonsConfirmed': 'No', 'dateModified': None,
+        }
+        used = rng.randint(2, 6)
+        for i in range(1, MAX_INGREDIENTS + 1):
+            record[f'strIngredient{i}'] = rng.choice(ingredients) if i <= used else None
+            record[f'strMeasure{i}'] = rng.choice(measures) if i <= used else None
+        records.append(record)
+    return records
+
+def measure_memory(count=10000):
+    ## Compare the retained memory of parsed upstream JSON (a list of dicts) with a
+    ## Catalog built from the same JSON.
+    text = json.dumps(synthetic_records(count))
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    dicts = json.loads(text)
+    dict_bytes = tracemalloc.get_traced_memory()[0] - start
+    del dicts
+
+    start = tracemalloc.get_traced_memory()[0]
+    records = json.loads(text)
+    catalog = Catalog.from_records(records)
+    del records
+    catalog_bytes = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return {'drinks': len(catalog), 'dict_records_bytes': dict_bytes, 'catalog_bytes': catalog_bytes}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the memory used by the compact catalog.')
+    parser.add_argument('--drinks', type=int, default=10000, help='number of synthetic drinks')
+    args = parser.parse_args()
+    result = measure_memory(args.drinks)
+    print(f"{result['drinks']} drinks: list of dicts {result['dict_records_bytes'] / 1e6:.1f} MB, "
+          f"catalog {result['catalog_bytes'] / 1e6:.1f} MB")
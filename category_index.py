@@ -0,0 +1,108 @@
+import threading
+import time
+import applog
+
+log = applog.get_logger('category_index')
+
+## In-memory index of drink categories and how many drinks each one holds.
+## The index is built once, served from memory until the TTL runs out and then
+## rebuilt on a background thread, so page renders only read the cached map.
+## Categories of the local CSV catalogs (see sources.py) are merged in without
+## going to the API.
+class CategoryIndex:
+    def __init__(self, list_categories, count_drinks, ttl=3600, retry_interval=60, mapper=map):
+        ## list_categories() returns the category names from the API.
+        ## count_drinks(name) returns the number of drinks in one category.
+        ## mapper(func, names) is used to count the categories, e.g. concurrently.
+        self.list_categories = list_categories
+        self.count_drinks = count_drinks
+        self.mapper = mapper
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._names = []
+        self._counts = {}
+        self._created_count = 0
+        self._local_counts = {}
+        self._built_at = None
+        self._next_refresh = 0
+        self._refreshing = False
+
+    def categories(self):
+        ## Return the categories in the format the templates expect.
+        if self._built_at is None:
+            ## Nothing has been built yet, so the very first callers wait for it.
+            with self._build_lock:
+                if self._built_at is None:
+                    self._build()
+        elif time.monotonic() >= self._next_refresh:
+            self.refresh_async()
+
+        with self._lock:
+            names = self._names + [name for name in self._local_counts if name not in self._names]
+            counts = {name: self._counts.get(name, 0) + self._local_counts.get(name, 0) for name in names}
+            categories = [{'name': name, 'has_drinks': counts[name] > 0, 'count': counts[name]} for name in names]
+            categories.append({'name': 'Created Recipes', 'has_drinks': self._created_count > 0, 'count': self._created_count})
+        return categories
+
+    def counts(self):
+        ## Return a copy of the category -> drink count map.
+        with self._lock:
+            counts = dict(self._counts)
+            for name, count in self._local_counts.items():
+                counts[name] = counts.get(name, 0) + count
+            counts['Created Recipes'] = self._created_count
+        return counts
+
+    def set_created_count(self, count):
+        ## Update the Created Recipes entry without going back to the API.
+        with self._lock:
+            self._created_count = count
+
+    def set_local_counts(self, counts):
+        ## Set the category -> drink count map of the local catalogs.
+        with self._lock:
+            self._local_counts = dict(counts)
+
+    def upstream_names(self):
+        ## The category names the API knows, as of the last build.
+        with self._lock:
+            return list(self._names)
+
+    def refresh(self):
+        ## Rebuild the index from the API. Keeps the old data if the API fails.
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        names = self.list_categories()
+        counts = dict(zip(names, self.mapper(self.count_drinks, names)))
+        now = time.monotonic()
+        with self._lock:
+            if names:
+                self._names = names
+                self._counts = counts
+                self._next_refresh = now + self.ttl
+            else:
+                self._next_refresh = now + self.retry_interval
+            self._built_at = now
+            self._refreshing = False
+
+    def refresh_async(self):
+        ## Start a background rebuild unless one is already running.
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._refresh_in_background, daemon=True)
+        thread.start()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            log.warning('Category index refresh failed', error=str(e))
+            with self._lock:
+                self._refreshing = False
+                self._next_refresh = time.monotonic() + self.retry_interval
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from mirror import Mirror, mirror_key
+from singleflight import SingleFlight
+import applog
+import metrics
+
+## Shared HTTP client for every call to thecocktaildb.com.
+## One keep-alive Session is reused by all requests, every call has a timeout,
+## failed calls are retried a few times with backoff, and map_concurrent runs
+## many lookups at once on a shared thread pool.
+## Set COCKTAILDB_API_URL to point the app at a local stub server.
+## get_json() goes through the local mirror (see mirror.py) so responses survive
+## API outages; COCKTAILDB_OFFLINE=1 serves only from the mirror. Identical calls
+## made at the same time are coalesced into one upstream request.
+## A forked worker process starts with a Session, thread pool and mirror connection of its own.
+
+API_URL = os.environ.get('COCKTAILDB_API_URL', 'https://www.thecocktaildb.com/api/json/v1/1')
+TIMEOUT = (float(os.environ.get('COCKTAILDB_CONNECT_TIMEOUT', 3)), float(os.environ.get('COCKTAILDB_READ_TIMEOUT', 10)))
+RETRIES = int(os.environ.get('COCKTAILDB_RETRIES', 2))
+BACKOFF = float(os.environ.get('COCKTAILDB_BACKOFF', 0.3))
+POOL_SIZE = int(os.environ.get('COCKTAILDB_POOL_SIZE', 16))
+MIRROR_PATH = os.environ.get('COCKTAILDB_MIRROR_PATH', os.path.join('data', 'mirror.sqlite'))
+MIRROR_TTL = float(os.environ.get('COCKTAILDB_MIRROR_TTL', 6 * 3600))
+OFFLINE = os.environ.get('COCKTAILDB_OFFLINE', '') not in ('', '0', 'false')
+SINGLEFLIGHT_TIMEOUT = float(os.environ.get('COCKTAILDB_SINGLEFLIGHT_TIMEOUT', 15))
+
+log = applog.get_logger('cocktail_api')
+
+_session = None
+_executor = None
+_mirror = None
+_lock = threading.Lock()
+_UNSET = object()
+## Base class of every error an API call can raise, for callers that don't import requests themselves
+UpstreamError = requests.exceptions.RequestException
+singleflight = SingleFlight(timeout=SINGLEFLIGHT_TIMEOUT)
+
+def _reset_after_fork():
+    ## Pool threads, pooled sockets and sqlite connections can't be shared with the parent.
+    global _session, _executor, _mirror, _lock, singleflight
+    if _mirror is not None:
+        _mirror = Mirror(_mirror.path, ttl=_mirror.ttl, offline=_mirror.offline)
+    _session = _executor = None
+    _lock = threading.Lock()
+    singleflight = SingleFlight(timeout=SINGLEFLIGHT_TIMEOUT)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def create_session(retries=None, backoff=None, pool_size=None):
+    ## Build a Session with a connection pool and retry policy.
+    retry = Retry(
+        total=RETRIES if retries is None else retries,
+        backoff_factor=BACKOFF if backoff is None else backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    size = pool_size or POOL_SIZE
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def get_session():
+    ## Return the shared Session, creating it on first use.
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def get_executor():
+    ## Return the shared thread pool used for concurrent lookups.
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='cocktaildb')
+    return _executor
+
+def get_mirror():
+    ## Return the shared mirror, or None if COCKTAILDB_MIRROR_PATH is empty.
+    global _mirror
+    if _mirror is None and MIRROR_PATH:
+        with _lock:
+            if _mirror is None:
+                _mirror = Mirror(MIRROR_PATH, ttl=MIRROR_TTL, offline=OFFLINE)
+    return _mirror
+
+def configure(api_url=None, timeout=None, retries=None, backoff=None, pool_size=None, mirror=_UNSET):
+    ## Change the client settings at runtime, e.g. to point at a stub server.
+    ## Pass mirror=None to turn the mirror off or a Mirror to use a different one.
+    global API_URL, TIMEOUT, RETRIES, BACKOFF, POOL_SIZE, MIRROR_PATH, _session, _mirror
+    with _lock:
+        if mirror is not _UNSET:
+            _mirror = mirror
+            if mirror is None:
+                MIRROR_PATH = ''
+        if api_url is not None:
+            API_URL = api_url.rstrip('/')
+        if timeout is not None:
+            TIMEOUT = timeout
+        if retries is not None:
+            RETRIES = retries
+        if backoff is not None:
+            BACKOFF = backoff
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        if _session is not None:
+            _session.close()
+        _session = None
+
+def url_for(endpoint):
+    ## Build the full URL of an API endpoint such as 'lookup.php'.
+    return f"{API_URL}/{endpoint}"
+
+def get(endpoint, params=None):
+    ## GET an API endpoint through the shared Session. Raises requests exceptions on failure.
+    return get_session().get(url_for(endpoint), params=params, timeout=TIMEOUT)
+
+def fetch_json(endpoint, params=None):
+    ## GET an API endpoint and return its JSON. Raises requests exceptions on errors and non-200 answers.
+    ## Latency and bytes are recorded per endpoint (the URL without its query string)
+    started = time.perf_counter()
+    try:
+        response = get(endpoint, params)
+    except requests.exceptions.RequestException:
+        metrics.UPSTREAM_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, status='error')
+        raise
+    elapsed = time.perf_counter() - started
+    metrics.UPSTREAM_LATENCY.observe(elapsed, endpoint=endpoint, status=response.status_code)
+    metrics.UPSTREAM_BYTES.inc(len(response.content), endpoint=endpoint)
+    log.info('Upstream call', url=response.url, status=response.status_code, latency_ms=round(elapsed * 1000, 2),
+             bytes=len(response.content))
+    response.raise_for_status()
+    return response.json()
+
+def fetch_json_coalesced(endpoint, params=None):
+    ## Like fetch_json, but concurrent identical calls share one upstream request.
+    ## The result is shared between the callers, so treat it as read-only.
+    return singleflight.do(mirror_key(endpoint, params), fetch_json, endpoint, params)
+
+def get_json(endpoint, params=None, record=True):
+    ## Return the JSON for an API call through the local mirror, or straight from the API without one.
+    ## With record=False a response the mirror doesn't have yet isn't added to it, e.g. for free-form input.
+    mirror = get_mirror()
+    if mirror is None:
+        return fetch_json_coalesced(endpoint, params)
+    return mirror.fetch(endpoint, params, fetch_json_coalesced, record)
+
+def map_concurrent(func, items):
+    ## Call func on every item using the shared thread pool and return the results in order.
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    return list(get_executor().map(func, items))
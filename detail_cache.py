@@ -0,0 +1,149 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+## Bounded TTL + LRU cache for drink details, keyed by drink id.
+## Unknown ids are cached too (as None) with a shorter TTL so repeated lookups
+## of a bad id don't go back to the API. An optional sqlite file keeps the
+## entries across restarts.
+
+class DetailCache:
+    def __init__(self, maxsize=1024, ttl=86400, negative_ttl=600, disk_path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._disk = DiskTier(disk_path) if disk_path else None
+
+    def get(self, key):
+        ## Return (True, value) on a hit, where value is None for a cached unknown id,
+        ## or (False, None) on a miss.
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    if value is None:
+                        self.negative_hits += 1
+                    return True, value
+                del self._entries[key]
+
+        if self._disk is not None:
+            entry = self._disk.get(key, now)
+            if entry is not None:
+                expires_at, value = entry
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    if value is None:
+                        self.negative_hits += 1
+                return True, value
+
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        ## Cache a value. Pass None to remember that the id does not exist.
+        expires_at = time.time() + (self.negative_ttl if value is None else self.ttl)
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self._disk is not None:
+            self._disk.put(key, value, expires_at)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._disk is not None:
+            self._disk.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self):
+        ## Return the hit/miss counters and the current size.
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'disk_hits': self.disk_hits,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _store(self, key, value, expires_at):
+        ## Caller must hold the lock.
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+class DiskTier:
+    ## sqlite file holding cache entries as JSON so they survive a restart.
+    ## Worker processes of a pre-forking server share the file, so a detail one worker
+    ## fetched is a disk hit for the others; each process opens its own connection.
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection()
+
+    def _connection(self):
+        ## The connection, reopened after a fork. Caller must hold the lock, except in __init__.
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)')
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._connection().execute('SELECT value, expires_at FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return row[1], json.loads(row[0])
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            conn = self._connection()
+            conn.execute('INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(value), expires_at))
+            conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            conn = self._connection()
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute('DELETE FROM entries')
+            conn.commit()
@@ -0,0 +1,137 @@
+import threading
+
+## Inverted index from normalized ingredient name -> ids of the drinks that use it.
+## Built from the full drink records (strIngredient1..15), so ingredient searches
+## are answered locally. Supports AND/OR queries over several ingredients and ranks
+## the drinks by how much of their ingredient list the query covers.
+
+SUMMARY_KEYS = ('idDrink', 'strDrink', 'strDrinkThumb', 'strCategory', 'strAlcoholic')
+
+def normalize_ingredient(name):
+    ## Lowercase and collapse whitespace so "Lime  Juice" and "lime juice" match.
+    if not isinstance(name, str):
+        return ''
+    return ' '.join(name.lower().split())
+
+def drink_ingredients(drink):
+    ## Return the set of normalized ingredients of a drink record.
+    ingredients = set()
+    for i in range(1, 16):
+        ingredient = normalize_ingredient(drink.get(f'strIngredient{i}'))
+        if ingredient:
+            ingredients.add(ingredient)
+    return ingredients
+
+def parse_ingredient_query(query):
+    ## Split "gin, lime" or "gin and lime" into a list of normalized ingredients.
+    query = normalize_ingredient(query).replace(' and ', ',').replace('+', ',')
+    return [term.strip() for term in query.split(',') if term.strip()]
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._drinks_by_ingredient = {}
+        self._ingredients_by_word = {}
+        self._ingredients_by_drink = {}
+        self._summaries = {}
+
+    def __len__(self):
+        return len(self._ingredients_by_drink)
+
+    def __getstate__(self):
+        ## Pickled into the catalog snapshot (see snapshot.py) without its lock
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def build(self, drinks):
+        ## Replace the index with the given drink records.
+        with self._lock:
+            self._drinks_by_ingredient = {}
+            self._ingredients_by_word = {}
+            self._ingredients_by_drink = {}
+            self._summaries = {}
+            for drink in drinks:
+                self._add(drink)
+
+    def add(self, drink):
+        ## Add or update one drink, e.g. a newly created recipe.
+        with self._lock:
+            self._remove(str(drink['idDrink']))
+            self._add(drink)
+
+    def remove(self, drink_id):
+        with self._lock:
+            self._remove(str(drink_id))
+
+    def ingredients(self):
+        ## Return all known ingredient names.
+        with self._lock:
+            return sorted(self._drinks_by_ingredient)
+
+    def search(self, ingredients, match='all'):
+        ## Find drinks using the given ingredients. match='all' requires every ingredient,
+        ## match='any' requires at least one. Results are ranked by the number of query
+        ## ingredients they use, then by the share of the drink's ingredients the query covers.
+        terms = [normalize_ingredient(i) for i in ingredients if normalize_ingredient(i)]
+        if not terms:
+            return []
+        with self._lock:
+            term_drinks = [self._drinks_for_term(term) for term in terms]
+            if match == 'any':
+                candidates = set().union(*term_drinks)
+            else:
+                candidates = set.intersection(*term_drinks)
+
+            results = []
+            for drink_id in candidates:
+                matched = sum(1 for drinks in term_drinks if drink_id in drinks)
+                total = len(self._ingredients_by_drink[drink_id])
+                summary = dict(self._summaries[drink_id])
+                summary['matched'] = matched
+                summary['coverage'] = matched / total if total else 0.0
+                results.append(summary)
+
+        results.sort(key=lambda d: (-d['matched'], -d['coverage'], d['strDrink'] or ''))
+        return results
+
+    def _drinks_for_term(self, term):
+        ## Caller must hold the lock. A term matches every ingredient containing all of
+        ## its words, so "lime" finds both "lime" and "lime juice".
+        word_sets = [self._ingredients_by_word.get(word, set()) for word in term.split()]
+        drinks = set()
+        for ingredient in set.intersection(*word_sets):
+            drinks |= self._drinks_by_ingredient[ingredient]
+        return drinks
+
+    def _add(self, drink):
+        drink_id = str(drink['idDrink'])
+        ingredients = drink_ingredients(drink)
+        if not ingredients:
+            return
+        self._ingredients_by_drink[drink_id] = ingredients
+        self._summaries[drink_id] = {key: drink.get(key) for key in SUMMARY_KEYS}
+        self._summaries[drink_id]['idDrink'] = drink_id
+        for ingredient in ingredients:
+            if ingredient not in self._drinks_by_ingredient:
+                self._drinks_by_ingredient[ingredient] = set()
+                for word in ingredient.split():
+                    self._ingredients_by_word.setdefault(word, set()).add(ingredient)
+            self._drinks_by_ingredient[ingredient].add(drink_id)
+
+    def _remove(self, drink_id):
+        for ingredient in self._ingredients_by_drink.pop(drink_id, ()):
+            ids = self._drinks_by_ingredient.get(ingredient)
+            if ids is not None:
+                ids.discard(drink_id)
+                if not ids:
+                    del self._drinks_by_ingredient[ingredient]
+                    for word in ingredient.split():
+                        self._ingredients_by_word[word].discard(ingredient)
+                        if not self._ingredients_by_word[word]:
+                            del self._ingredients_by_word[word]
+        self._summaries.pop(drink_id, None)
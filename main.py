@@ -1,275 +1,724 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-import pandas as pd
-import requests
+from flask import Flask, Response, current_app, render_template, request, redirect, url_for, jsonify, stream_with_context, g, abort
+from flask import before_render_template, template_rendered
+import functools
 import os
-from datetime import datetime
+import math
+import sys
+import threading
+import time
+from datetime import date, datetime
 import random
-from fractions import Fraction
-from urllib.parse import quote
-from werkzeug.utils import secure_filename
+from category_index import CategoryIndex
+from detail_cache import DetailCache
+from ingredient_index import IngredientIndex, parse_ingredient_query
+from name_index import NameIndex
+from page_cache import PageCache
+from pagination import page_args, paginate
+from batch import NDJSON_MIMETYPE, BatchError, check_rating, parse_rating, parse_recipe, read_items, write_items
+from catalog import Catalog, compact_record
+from measurements import convert_measure, convert_recipe
+from uploads import UploadPipeline, UploadError
+from storage import Store, DB_PATH
+from recipe_registry import STATUSES, RecipeRegistry
+from recommender import Recommender, daily_pick
+from snapshot import load_snapshot, save_snapshot
+from sources import UPSTREAM_SOURCE, SourceWatcher, changed_sources, is_local, merge_records, sync_sources
+from warmup import Warmup
+import applog
+import metrics
+from profiling import RequestProfiler
 
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
+## The app is built by create_app(). Building it is cheap: the API client (and with it
+## requests) is imported on the first call to TheCocktailDB, and the catalog, recipes
+## and search indexes are loaded by a background warmup while the server is already
+## accepting connections. Requests wait for the warmup (up to WARMUP_WAIT seconds);
+## /ready reports its progress. `python main.py`, `flask --app main run` and
+## `gunicorn main:app` keep working through the module-level `app`; serve.py is the
+## production entry point with several worker processes.
 
-## Ensure the data directory exists
-if not os.path.exists('data'):
-    os.makedirs('data')
+log = applog.get_logger('main')
 
-## Ensure the upload directory exists
-if not os.path.exists(app.config.get('UPLOAD_FOLDER', 'static/uploads')):
-    os.makedirs(app.config.get('UPLOAD_FOLDER', 'static/uploads'))
+ROUTES = []
 
-## Load the list of drinks and their details from the CSV file
-def create_drinks_table():
+def route(rule, **options):
+    ## Like @app.route; create_app() registers the views on the app it builds.
+    def decorate(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorate
+
+def in_app_context(app, func):
+    ## Wrap func so it runs inside the app context, for background threads.
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            return func(*args, **kwargs)
+    return wrapper
+
+def create_app(config=None):
+    ## Build the app. Only cheap setup happens here; the data is loaded by the warmup.
+    applog.setup_logging()
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = 'static/uploads'
+
+    ## Uploaded images are capped in size, stored by content hash and get thumbnails in the background
+    app.config["MAX_UPLOAD_BYTES"] = int(os.environ.get('MAX_UPLOAD_BYTES', 5 * 1024 * 1024))
+    app.config["MAX_CONTENT_LENGTH"] = app.config["MAX_UPLOAD_BYTES"] + 1024 * 1024
+    ## Batches of ratings and recipes (see batch.py) may be larger; only their routes allow this much
+    app.config["BATCH_MAX_BYTES"] = int(os.environ.get('BATCH_MAX_BYTES', 32 * 1024 * 1024))
+
+    ## Uploads never change once stored, so they can be cached for a year; other static files for an hour
+    app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 3600
+
+    ## Drinks, saved recipes and created recipes are stored in a sqlite database (see storage.py).
+    ## The loaded catalog and search indexes are snapshotted next to it (see snapshot.py);
+    ## set CATALOG_SNAPSHOT_PATH to an empty string to always build them from the database.
+    app.config["DATABASE_PATH"] = os.environ.get('DATABASE_PATH', DB_PATH)
+    app.config["CATALOG_SNAPSHOT_PATH"] = os.environ.get('CATALOG_SNAPSHOT_PATH', app.config["DATABASE_PATH"] + '.catalog')
+    ## The local CSV catalogs (see sources.py) are checked for changes this often, in seconds
+    app.config["CATALOG_CHECK_INTERVAL"] = float(os.environ.get('CATALOG_CHECK_INTERVAL', 5))
+
+    ## The similar-drinks model (see recommender.py) is snapshotted next to the database too
+    app.config["RECOMMENDER_SNAPSHOT_PATH"] = os.environ.get('RECOMMENDER_SNAPSHOT_PATH', app.config["DATABASE_PATH"] + '.similar')
+    ## Drinks listed under "Similar Drinks" on a recipe page
+    app.config["SIMILAR_DRINKS"] = int(os.environ.get('SIMILAR_DRINKS', 6))
+
+    ## Drink details from the API are cached in memory, and in a sqlite file so they survive restarts.
+    ## Set DETAIL_CACHE_PATH to an empty string to keep the cache in memory only.
+    app.config["DETAIL_CACHE_SIZE"] = int(os.environ.get('DETAIL_CACHE_SIZE', 2048))
+    app.config["DETAIL_CACHE_TTL"] = int(os.environ.get('DETAIL_CACHE_TTL', 7 * 24 * 3600))
+    app.config["DETAIL_CACHE_NEGATIVE_TTL"] = int(os.environ.get('DETAIL_CACHE_NEGATIVE_TTL', 600))
+    app.config["DETAIL_CACHE_PATH"] = os.environ.get('DETAIL_CACHE_PATH', 'data/detail_cache.sqlite')
+
+    ## Rendered home, category and recipe pages; see cached_page. 0 turns the cache off,
+    ## the pages still get an ETag
+    app.config["PAGE_CACHE_SIZE"] = int(os.environ.get('PAGE_CACHE_SIZE', 512))
+    app.config["PAGE_CACHE_TTL"] = int(os.environ.get('PAGE_CACHE_TTL', 300))
+    ## Browsers and proxies may keep the pages but must check the ETag before using them
+    app.config["PAGE_CACHE_CONTROL"] = os.environ.get('PAGE_CACHE_CONTROL', 'no-cache')
+
+    ## The category index is built in the background and refreshed when its TTL runs out,
+    ## so page renders never fan out one API call per category.
+    app.config["CATEGORY_INDEX_TTL"] = int(os.environ.get('CATEGORY_INDEX_TTL', 3600))
+
+    ## How long a request waits for the warmup before it gets a 503
+    app.config["WARMUP_WAIT"] = float(os.environ.get('WARMUP_WAIT', 30))
+    app.config["WARMUP_ON_START"] = True
+    if config:
+        app.config.update(config)
+
+    ## Ensure the data and upload directories exist
+    os.makedirs('data', exist_ok=True)
+    os.makedirs(os.path.dirname(app.config["DATABASE_PATH"]) or '.', exist_ok=True)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    app.config["UPLOADS"] = UploadPipeline(app.config['UPLOAD_FOLDER'], max_bytes=app.config["MAX_UPLOAD_BYTES"])
+    ## Set PROFILE_SAMPLE_RATE to profile a share of the requests (see profiling.py)
+    app.config["PROFILER"] = RequestProfiler()
+    app.config["STORE"] = Store(app.config["DATABASE_PATH"])
+    app.config["DETAIL_CACHE"] = DetailCache(maxsize=app.config["DETAIL_CACHE_SIZE"],
+                                             ttl=app.config["DETAIL_CACHE_TTL"],
+                                             negative_ttl=app.config["DETAIL_CACHE_NEGATIVE_TTL"],
+                                             disk_path=app.config["DETAIL_CACHE_PATH"] or None)
+    app.config["PAGE_CACHE"] = PageCache(maxsize=app.config["PAGE_CACHE_SIZE"], ttl=app.config["PAGE_CACHE_TTL"])
+    app.config["CATEGORY_INDEX"] = CategoryIndex(in_app_context(app, fetch_category_names),
+                                                  in_app_context(app, count_drinks_in_category),
+                                                  ttl=app.config["CATEGORY_INDEX_TTL"], mapper=map_concurrent)
+
+    ## Empty until the warmup has loaded them
+    app.config["CATALOG"] = Catalog()
+    app.config["CATALOG_VERSION"] = None
+    ## Drinks of the local catalogs by category, served without the API
+    app.config["LOCAL_CATEGORIES"] = {}
+    app.config["SOURCE_WATCHER"] = SourceWatcher(app.config["CATALOG_CHECK_INTERVAL"])
+    ## Saved and created recipes, keyed by idDrink
+    app.config["RECIPES"] = RecipeRegistry()
+    ## Version of the stored recipes the registry is up to date with (see sync_recipes)
+    app.config["RECIPES_VERSION"] = None
+    app.config["NAME_INDEX"] = NameIndex()
+    app.config["INGREDIENT_INDEX"] = IngredientIndex()
+    ## Similar drinks, built from the catalog after it is loaded (see load_recommender)
+    app.config["RECOMMENDER"] = Recommender()
+    app.config["RECOMMENDER_VERSION"] = None
+    ## (date, catalog version, drink) of the last drink of the day
+    app.config["DRINK_OF_THE_DAY"] = None
+
+    app.before_request(start_timer)
+    app.before_request(wait_until_ready)
+    app.before_request(sync_recipes)
+    app.before_request(check_catalog)
+    app.after_request(log_request)
+    app.after_request(cache_uploads)
+    before_render_template.connect(start_render_timer, app)
+    template_rendered.connect(stop_render_timer, app)
+    app.add_template_filter(thumbnail, 'thumbnail')
+    app.register_error_handler(404, page_not_found)
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+    metrics.REGISTRY.add_collector(lambda: collect_app_metrics(app), name='app')
+
+    warmup = app.config["WARMUP"] = Warmup()
+    warmup.add('recipes', in_app_context(app, load_recipes))
+    warmup.add('catalog', in_app_context(app, load_catalog))
+    warmup.add('bootstrap', in_app_context(app, initialize_drinks), required=False)
+    ## Warm the category index before the first page view.
+    warmup.add('category_index', in_app_context(app, fetch_categories_with_drinks), required=False)
+    ## Recipe pages show no similar drinks until this step is done
+    warmup.add('recommender', in_app_context(app, load_recommender), required=False)
+    if app.config["WARMUP_ON_START"]:
+        warmup.start()
+    return app
+
+def load_recipes():
+    store = current_app.config["STORE"]
+    ## The first start imports the CSV files from data/ into the database
+    store.import_csv_files()
+    current_app.config["RECIPES_VERSION"] = store.recipes_version()
+    current_app.config["RECIPES"].load(saved=store.recipes('saved'), created=store.recipes('created'))
+    update_created_recipes_count()
+
+def load_catalog():
+    ## Load the catalog and its search indexes into memory: from the snapshot if the drinks
+    ## in the database haven't changed since it was written, otherwise from the database.
+    ## Local CSV catalogs that changed since the last load are written to the database first.
+    store = current_app.config["STORE"]
+    snapshot_path = current_app.config["CATALOG_SNAPSHOT_PATH"]
+    changed = sync_sources(store)
+    if changed:
+        log.info('Local catalogs imported', **changed)
+    version = store.drinks_version()
+    objects = load_snapshot(snapshot_path, version)
+    if objects is not None:
+        catalog, name_index, ingredient_index = objects['catalog'], objects['name_index'], objects['ingredient_index']
+        log.info('Drinks table loaded from snapshot', drinks=len(catalog), path=snapshot_path)
+    else:
+        catalog = Catalog.from_records(merge_records(store.catalog_records_by_source()))
+        name_index, ingredient_index = NameIndex(), IngredientIndex()
+        name_index.build(catalog)
+        ingredient_index.build(catalog)
+        log.info('Drinks table created', drinks=len(catalog))
+        try:
+            save_snapshot(snapshot_path, version, catalog=catalog, name_index=name_index, ingredient_index=ingredient_index)
+        except OSError as e:
+            log.warning('Could not write the catalog snapshot', path=snapshot_path, error=str(e))
+    ## Created recipes are searchable too but live outside the snapshot
+    for drink in current_app.config["RECIPES"].by_status('created'):
+        name_index.add(drink)
+        ingredient_index.add(drink)
+    local_categories = {}
+    for i, drink_id in enumerate(catalog.ids()):
+        if is_local(drink_id):
+            row = catalog[i]
+            local_categories.setdefault(row.get('strCategory'), []).append(row)
+    local_categories.pop(None, None)
+    current_app.config["CATEGORY_INDEX"].set_local_counts({name: len(rows) for name, rows in local_categories.items()})
+    current_app.config.update(CATALOG=catalog, CATALOG_VERSION=version, NAME_INDEX=name_index,
+                              INGREDIENT_INDEX=ingredient_index, LOCAL_CATEGORIES=local_categories)
+
+_recommender_lock = threading.Lock()
+
+def load_recommender():
+    ## Build the similar-drinks model of the current catalog, or load it from its snapshot.
+    ## Created recipes are added on top, like in the search indexes.
+    recommender = current_app.config["RECOMMENDER"]
+    if not recommender.available:
+        return
+    with _recommender_lock:
+        version = current_app.config["CATALOG_VERSION"]
+        if version is None or version == current_app.config["RECOMMENDER_VERSION"]:
+            return
+        snapshot_path = current_app.config["RECOMMENDER_SNAPSHOT_PATH"]
+        objects = load_snapshot(snapshot_path, version)
+        if objects is not None:
+            recommender = objects['recommender']
+            log.info('Recommender loaded from snapshot', drinks=len(recommender), path=snapshot_path)
+        else:
+            recommender = Recommender()
+            recommender.build(current_app.config["CATALOG"])
+            log.info('Recommender built', drinks=len(recommender), seconds=recommender.build_seconds)
+            try:
+                save_snapshot(snapshot_path, version, recommender=recommender)
+            except OSError as e:
+                log.warning('Could not write the recommender snapshot', path=snapshot_path, error=str(e))
+        for drink in current_app.config["RECIPES"].by_status('created'):
+            recommender.add(drink)
+        current_app.config.update(RECOMMENDER=recommender, RECOMMENDER_VERSION=version)
+
+_catalog_lock = threading.Lock()
+
+def check_catalog():
+    ## Every CATALOG_CHECK_INTERVAL seconds, reload the catalog in the background if a local
+    ## CSV file changed or another process (a worker, the bootstrap) changed the drinks.
+    if request.endpoint in READY_EXEMPT or not current_app.config["WARMUP"].ready:
+        return None
+    if not current_app.config["SOURCE_WATCHER"].due():
+        return None
+    store = current_app.config["STORE"]
+    if changed_sources(store) or store.drinks_version() != current_app.config["CATALOG_VERSION"]:
+        threading.Thread(target=in_app_context(current_app._get_current_object(), reload_catalog),
+                         name='catalog-reload', daemon=True).start()
+    return None
+
+def reload_catalog():
+    ## Requests keep using the old catalog until the new one is swapped in.
+    if not _catalog_lock.acquire(blocking=False):
+        return
     try:
-        drinks_df = pd.read_csv('data/default.csv')
-    except FileNotFoundError:
-        ## Create an empty DataFrame with the required columns if the file doesn't exist
-        drinks_df = pd.DataFrame(columns=['idDrink', 'strDrink', 'strCategory', 'strDrinkThumb', 'strIngredient1', 'strAlcoholic'])
-        drinks_df.to_csv('data/default.csv', index=False)  ## Save the empty DataFrame to avoid future errors
-    print('Drinks table created:\n', drinks_df.head())
-    return drinks_df
-
-app.config["DRINKS_DF"] = create_drinks_table()
-app.config["SAVED_RECIPES"] = []
-app.config["CREATED_RECIPES"] = []
-
-def save_drinks(df):
-    ## Save the drinks DataFrame to a CSV file.
-    df.to_csv('data/default.csv', index=False)
+        load_catalog()
+        log.info('Catalog reloaded', drinks=len(current_app.config["CATALOG"]), version=current_app.config["CATALOG_VERSION"])
+        reload_recommender()
+    except Exception as e:
+        log.exception('Catalog reload failed', error=str(e))
+    finally:
+        _catalog_lock.release()
 
-def fetch_categories_with_drinks():
-    ## Fetch drink categories from the API and check if they have drinks.
-    response = requests.get('https://www.thecocktaildb.com/api/json/v1/1/list.php?c=list')
+def reload_recommender():
+    ## After a catalog reload; until the warmup built it once, that step takes care of it.
+    if current_app.config["RECOMMENDER_VERSION"] is not None:
+        load_recommender()
+
+## Endpoints that answer while the warmup is still running
+READY_EXEMPT = ('ready', 'metrics', 'static')
+
+def wait_until_ready():
+    ## Hold requests that need the catalog until the warmup has loaded it.
+    if request.endpoint in READY_EXEMPT:
+        return None
+    warmup = current_app.config["WARMUP"]
+    warmup.start()
+    if not warmup.wait(current_app.config["WARMUP_WAIT"]):
+        return Response('Warming up, please try again in a moment.', status=503, headers={'Retry-After': '1'})
+    return None
+
+_recipes_lock = threading.Lock()
+
+def sync_recipes():
+    ## With several worker processes a recipe may have been saved or rated by another one.
+    ## The database keeps a version for the recipes; when it moved, apply what changed.
+    if request.endpoint in READY_EXEMPT or not current_app.config["WARMUP"].ready:
+        return None
+    reload_recipes()
+    return None
+
+def reload_recipes():
+    ## Apply the recipes another worker saved, rated or deleted since the version this one
+    ## has: only those rows are read and only the created ones among them are reindexed.
+    store = current_app.config["STORE"]
+    if store.recipes_version() == current_app.config["RECIPES_VERSION"]:
+        return
+    with _recipes_lock:
+        version = store.recipes_version()
+        if version == current_app.config["RECIPES_VERSION"]:
+            return
+        recipes = current_app.config["RECIPES"]
+        ## Rows changed after `version` was read are applied now and again next time, which is harmless
+        changed, deleted = store.recipe_changes(current_app.config["RECIPES_VERSION"])
+        for drink_id in deleted:
+            if recipes.status(drink_id) == 'created':
+                unindex_drink(drink_id)
+            recipes.remove(drink_id)
+        for status, record in changed:
+            if status != 'created' and recipes.status(record['idDrink']) == 'created':
+                unindex_drink(record['idDrink'])
+            recipes.put(record, status)
+            if status == 'created':
+                index_drink(record)
+        update_created_recipes_count()
+        current_app.config["RECIPES_VERSION"] = version
+        log.debug('Recipes synced', version=version, changed=len(changed), deleted=len(deleted))
+
+def start_timer():
+    g.request_started = time.perf_counter()
+    g.profile = current_app.config["PROFILER"].start()
+
+def log_request(response):
+    ## One structured line per request; static files are only logged at DEBUG.
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    fields = {'route': request.endpoint, 'method': request.method, 'path': request.path,
+              'status': response.status_code, 'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+    drink_id = (request.view_args or {}).get('drink_id')
+    if drink_id is not None:
+        fields['drink_id'] = drink_id
+    if 'page_cache' in g:
+        fields['cache'] = g.page_cache
+    if request.endpoint == 'static':
+        log.debug('Request', **fields)
+    else:
+        log.info('Request', **fields)
+
+    ## The latency histogram and the profile are closed once the body is sent, so streamed pages count in full
+    route, method, status, profile = request.endpoint or 'unmatched', request.method, response.status_code, g.pop('profile', None)
+    profiler = current_app.config["PROFILER"]
+    def finish():
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, route=route, method=method, status=status)
+        if profile is not None:
+            path = profiler.stop(profile, route)
+            log.info('Request profiled', route=route, profile=path)
+    response.call_on_close(finish)
+    return response
+
+def start_render_timer(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+def stop_render_timer(sender, template, context, **extra):
+    started = g.get('render_started')
+    if started:
+        metrics.STAGE_LATENCY.observe(time.perf_counter() - started.pop(), stage=f'render:{template.name}')
+
+def cache_uploads(response):
+    if request.endpoint == 'static' and (request.view_args or {}).get('filename', '').startswith('uploads/') and response.status_code == 200:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def thumbnail(url, size='small'):
+    ## Use the small variant of an image in listings: the generated thumbnail for uploads,
+    ## the resized preview for TheCocktailDB images, and the original for anything else.
+    if not url:
+        return url
+    marker = '/static/uploads/'
+    if marker in url:
+        filename = url.split(marker, 1)[1]
+        thumb = current_app.config["UPLOADS"].thumbnail_for(filename, size)
+        return url.replace(filename, thumb) if thumb else url
+    if 'thecocktaildb.com/images/media/drink/' in url and not url.endswith(('/small', '/medium', '/large')):
+        ## TheCocktailDB serves /small at 100px and /medium at 350px; listings show 200px
+        return url + '/medium'
+    return url
+
+def map_concurrent(func, items):
+    ## Run func over items on the API client's thread pool.
+    import cocktail_api
+    return cocktail_api.map_concurrent(func, items)
+
+def fetch_category_names():
+    ## Fetch the drink category names from the API (or its local mirror).
+    import cocktail_api
     try:
-        if response.status_code == 200:
-            json_response = response.json()
-            categories = [{'name': item['strCategory'], 'has_drinks': bool(fetch_drinks_by_category(item['strCategory']))}
-                          for item in json_response['drinks']
-                          if '/' not in item['strCategory']]
-            categories.append({'name': 'Created Recipes', 'has_drinks': bool(app.config["CREATED_RECIPES"])})
-            print(f"Categories fetched: {categories}")
-            return categories
-        print(f"Failed to fetch categories. Status code: {response.status_code}. Response: {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Request exception for categories. Error: {e}")
-    except requests.exceptions.JSONDecodeError as e:
-        print(f"JSON decode error when fetching categories. Error: {e}. Response: {response.text}")
+        json_response = cocktail_api.get_json('list.php', params={'c': 'list'})
+        return [item['strCategory'] for item in json_response.get('drinks') or [] if '/' not in item['strCategory']]
+    except cocktail_api.UpstreamError as e:
+        log.warning('Request exception for categories', error=str(e))
     return []
 
+def count_drinks_in_category(category):
+    ## Count the drinks TheCocktailDB has in a category, used to build the category index.
+    ## The index adds the drinks of the local catalogs itself.
+    return len(fetch_upstream_drinks_by_category(category))
+
+@metrics.timed('fetch_categories_with_drinks')
+def fetch_categories_with_drinks():
+    ## Read the drink categories and whether they have drinks from the category index.
+    return current_app.config["CATEGORY_INDEX"].categories()
+
+def update_created_recipes_count():
+    ## Keep the Created Recipes entry of the category index in sync with the recipe registry.
+    current_app.config["CATEGORY_INDEX"].set_created_count(current_app.config["RECIPES"].count('created'))
+
+@metrics.timed('fetch_drinks_by_category')
 def fetch_drinks_by_category(category):
     ## Fetch drinks by category from the API or local storage.
     if category == 'Created Recipes':
-        return app.config["CREATED_RECIPES"]
+        return current_app.config["RECIPES"].by_status('created')
+    ## Categories only the local catalogs have are served without the API
+    local = current_app.config["LOCAL_CATEGORIES"].get(category, [])
+    if local and category not in current_app.config["CATEGORY_INDEX"].upstream_names():
+        return list(local)
+    return fetch_upstream_drinks_by_category(category) + local
+
+def fetch_upstream_drinks_by_category(category):
+    ## Fetch the drinks of a category from the API, or [] if that fails.
+    import cocktail_api
     try:
-        response = requests.get(f'https://www.thecocktaildb.com/api/json/v1/1/filter.php?c={quote(category)}')
-        if response.status_code == 200:
-            json_response = response.json()
-            if 'drinks' in json_response:
-                print(f"Drinks for category {category}: {json_response['drinks']}")
-                return json_response['drinks']
-        print(f"Failed to fetch drinks for category {category}. Status code: {response.status_code}. Response: {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Request exception for category {category}. Error: {e}")
-    except requests.exceptions.JSONDecodeError as e:
-        print(f"JSON decode error for category {category}. Error: {e}. Response: {response.text}")
+        json_response = cocktail_api.get_json('filter.php', params={'c': category})
+        if json_response.get('drinks'):
+            log.payload('Drinks for category', category=category, drinks=json_response['drinks'])
+            return json_response['drinks']
+    except cocktail_api.UpstreamError as e:
+        log.warning('Request exception for category', category=category, error=str(e))
     return []
 
+@metrics.timed('fetch_drinks_by_name')
 def fetch_drinks_by_name(name):
-    ## Fetch drinks by name from the local storage and API.
-    drinks = app.config["DRINKS_DF"][app.config["DRINKS_DF"]['strDrink'].str.contains(name, case=False, na=False)].to_dict('records')
-    created_drinks = [d for d in app.config["CREATED_RECIPES"] if name.lower() in d['strDrink'].lower()]
-    return drinks + created_drinks
+    ## Find drinks by name in the local name index (catalog and created recipes).
+    return current_app.config["NAME_INDEX"].search(name)
+
+def search_drinks_by_letter(letter):
+    ## Find drinks by first letter in the local name index.
+    ## Only goes to the API while the catalog is still empty.
+    if len(current_app.config["NAME_INDEX"]) == 0:
+        return fetch_drinks_by_letter(letter)
+    return current_app.config["NAME_INDEX"].prefix(letter)
+
+def unindex_drink(drink_id):
+    ## Remove a deleted created recipe from the search indexes.
+    current_app.config["NAME_INDEX"].remove(drink_id)
+    current_app.config["INGREDIENT_INDEX"].remove(drink_id)
+    current_app.config["RECOMMENDER"].remove(drink_id)
+
+def index_drink(drink):
+    ## Add a new or changed drink to the search indexes.
+    current_app.config["NAME_INDEX"].add(drink)
+    current_app.config["INGREDIENT_INDEX"].add(drink)
+    current_app.config["RECOMMENDER"].add(drink)
+
+@metrics.timed('search_drinks_by_ingredient')
+def search_drinks_by_ingredient(ingredient, match='all'):
+    ## Search the local ingredient index. Several ingredients can be given as "gin, lime";
+    ## match='all' needs every one of them and match='any' needs at least one.
+    ## A single ingredient the index doesn't know is still looked up through the API, but
+    ## not added to the mirror: any text can be searched for, and the mirror never shrinks.
+    terms = parse_ingredient_query(ingredient)
+    if not terms:
+        return []
+    drinks = current_app.config["INGREDIENT_INDEX"].search(terms, match)
+    if not drinks and len(terms) == 1:
+        drinks = fetch_drinks_by_ingredient(ingredient)
+    return drinks
 
 def fetch_drinks_by_ingredient(ingredient):
-    ## Fetch drinks by ingredient from the API.
+    ## Fetch drinks by ingredient from the API (or its local mirror, without adding to it).
+    import cocktail_api
     try:
-        response = requests.get(f'https://www.thecocktaildb.com/api/json/v1/1/filter.php?i={ingredient}')
-        if response.status_code == 200:
-            json_response = response.json()
-            if 'drinks' in json_response:
-                return json_response['drinks']
-        print(f"Failed to fetch drinks by ingredient {ingredient}. Status code: {response.status_code}. Response: {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Request exception for ingredient {ingredient}. Error: {e}")
-    except requests.exceptions.JSONDecodeError as e:
-        print(f"JSON decode error for ingredient {ingredient}. Error: {e}. Response: {response.text}")
+        json_response = cocktail_api.get_json('filter.php', params={'i': ingredient}, record=False)
+        if json_response.get('drinks'):
+            return json_response['drinks']
+    except cocktail_api.UpstreamError as e:
+        log.warning('Request exception for ingredient', ingredient=ingredient, error=str(e))
     return []
 
+@metrics.timed('fetch_drink_details')
 def fetch_drink_details(drink_id):
     ## Fetch drink details by ID from local storage or the API.
-    ## Check if the drink_id is for a custom saved recipe
-    saved_recipe = next((d for d in app.config["SAVED_RECIPES"] if d['idDrink'] == drink_id), None)
-    if saved_recipe:
-        return saved_recipe
+    import cocktail_api
+    ## Check if the drink_id is for a saved or created recipe
+    recipe = current_app.config["RECIPES"].get(drink_id)
+    if recipe:
+        return recipe
+
+    ## Drinks of the local catalogs are never looked up upstream
+    if is_local(drink_id):
+        row = current_app.config["CATALOG"].get(drink_id)
+        return compact_record(row.to_dict()) if row is not None else None
 
-    ## Check if the drink_id is for a custom created recipe
-    created_recipe = next((d for d in app.config["CREATED_RECIPES"] if d['idDrink'] == drink_id), None)
-    if created_recipe:
-        return created_recipe
+    ## Then check the detail cache, which also remembers ids the API doesn't know
+    found, cached = current_app.config["DETAIL_CACHE"].get(drink_id)
+    if found:
+        return dict(cached) if cached is not None else None
 
-    ## Otherwise, fetch from the API
+    ## Otherwise, fetch from the API (or its local mirror)
     try:
-        response = requests.get(f'https://www.thecocktaildb.com/api/json/v1/1/lookup.php?i={drink_id}')
-        if response.status_code == 200:
-            json_response = response.json()
-            if 'drinks' in json_response:
-                return json_response['drinks'][0]
-        print(f"Failed to fetch drink details for id {drink_id}. Status code: {response.status_code}. Response: {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Request exception for drink id {drink_id}. Error: {e}")
-    except requests.exceptions.JSONDecodeError as e:
-        print(f"JSON decode error for drink id {drink_id}. Error: {e}. Response: {response.text}")
+        json_response = cocktail_api.get_json('lookup.php', params={'i': drink_id})
+        drinks = json_response.get('drinks')
+        ## Only the non-empty fields are kept; templates treat the missing ones as empty
+        details = compact_record(drinks[0]) if drinks else None
+        current_app.config["DETAIL_CACHE"].put(drink_id, details)
+        return dict(details) if details else None
+    except cocktail_api.UpstreamError as e:
+        log.warning('Request exception for drink', drink_id=drink_id, error=str(e))
     return None
 
 def fetch_drinks_by_filter(categories=None):
     ## Fetch drinks by categories from the local storage.
-    drinks = app.config["DRINKS_DF"]
+    drinks = current_app.config["CATALOG"]
     if categories:
-        drinks = drinks[drinks['strCategory'].isin(categories)]
-    return drinks
+        return drinks.in_categories(categories)
+    return list(drinks)
 
 def fetch_drinks_by_letter(letter):
-    ## Fetch drinks by the first letter from the API.
+    ## Fetch drinks by the first letter from the API (or its local mirror).
+    import cocktail_api
     try:
-        response = requests.get(f'https://www.thecocktaildb.com/api/json/v1/1/search.php?f={letter}')
-        if response.status_code == 200:
-            json_response = response.json()
-            if 'drinks' in json_response:
-                drinks = json_response['drinks']
-                for drink in drinks:
-                    drink.setdefault('strAlcoholic', None)
-                return drinks
-        print(f"Failed to fetch drinks by letter {letter}. Status code: {response.status_code}. Response: {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Request exception for letter {letter}. Error: {e}")
-    except requests.exceptions.JSONDecodeError as e:
-        print(f"JSON decode error for letter {letter}. Error: {e}. Response: {response.text}")
+        json_response = cocktail_api.get_json('search.php', params={'f': letter})
+        ## Copy the rows; the response may be shared with concurrent callers
+        return [dict({'strAlcoholic': None}, **drink) for drink in json_response.get('drinks') or []]
+    except cocktail_api.UpstreamError as e:
+        log.warning('Request exception for letter', letter=letter, error=str(e))
     return []
 
 def fetch_drinks_by_alcoholic(alcoholic):
-    ## Fetch drinks by alcoholic content from the API.
+    ## Fetch drinks by alcoholic content from the API (or its local mirror).
+    import cocktail_api
     if alcoholic == "Alcoholic":
-        url = 'https://www.thecocktaildb.com/api/json/v1/1/filter.php?a=Alcoholic'
+        params = {'a': 'Alcoholic'}
     else:
-        url = 'https://www.thecocktaildb.com/api/json/v1/1/filter.php?a=Non_Alcoholic'
+        params = {'a': 'Non_Alcoholic'}
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            json_response = response.json()
-            if 'drinks' in json_response:
-                drinks = json_response['drinks']
-                for drink in drinks:
-                    drink['strAlcoholic'] = alcoholic
-                return drinks
-        print(f"Failed to fetch drinks by alcoholic type {alcoholic}. Status code: {response.status_code}. Response: {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Request exception for alcoholic type {alcoholic}. Error: {e}")
-    except requests.exceptions.JSONDecodeError as e:
-        print(f"JSON decode error for alcoholic type {alcoholic}. Error: {e}. Response: {response.text}")
+        json_response = cocktail_api.get_json('filter.php', params=params)
+        return [dict(drink, strAlcoholic=alcoholic) for drink in json_response.get('drinks') or []]
+    except cocktail_api.UpstreamError as e:
+        log.warning('Request exception for alcoholic type', alcoholic=alcoholic, error=str(e))
     return []
 
-def get_random_drink():
-    ## Get a random drink from the local storage.
-    drinks = app.config["DRINKS_DF"]
-    if not drinks.empty:
-        return drinks.sample(1).iloc[0].to_dict()
-    return {}
+@metrics.timed('get_drink_of_the_day')
+def get_drink_of_the_day():
+    ## The featured drink of the home page: the same all day, in every worker.
+    ## Picked again when the day or the catalog changes.
+    today = date.today()
+    version = current_app.config["CATALOG_VERSION"]
+    cached = current_app.config["DRINK_OF_THE_DAY"]
+    if cached is not None and cached[:2] == (today, version):
+        return cached[2]
+    catalog = current_app.config["CATALOG"]
+    drink_id = daily_pick(catalog.ids(), today)
+    drink = catalog.get(drink_id) if drink_id is not None else None
+    drink = drink or {}
+    current_app.config["DRINK_OF_THE_DAY"] = (today, version, drink)
+    return drink
+
+@metrics.timed('similar_drinks')
+def similar_drinks(drink_id, limit=None):
+    ## Return [(drink, similarity)] of the drinks with the most ingredients in common, best first.
+    limit = limit or current_app.config["SIMILAR_DRINKS"]
+    similar = []
+    for other_id, score in current_app.config["RECOMMENDER"].similar(drink_id, limit):
+        drink = current_app.config["CATALOG"].get(other_id) or current_app.config["RECIPES"].get(other_id)
+        if drink is not None:
+            similar.append((drink, score))
+    return similar
 
 def convert_to_metric(measurement):
     ## Convert measurement units to metric.
-    conversions = {
-        'oz': 29.5735,
-        'lb': 453.592,
-        'cup': 240,
-        'ml': 1,
-        'cl': 10,
-        'l': 1000
-    }
-    try:
-        if measurement:
-            parts = measurement.split()
-            if len(parts) == 2:
-                amount, unit = parts
-            elif len(parts) == 3 and parts[1] in ["to", "taste"]:
-                return measurement
-            else:
-                amount = parts[0]
-                unit = parts[-1]
-
-            amount = float(Fraction(amount))
-            if unit in conversions:
-                return f"{amount * conversions[unit]:.2f} ml"
-    except (ValueError, AttributeError):
-        return measurement
-    return measurement
+    return convert_measure(measurement, 'metric')
 
 def convert_to_imperial(measurement):
     ## Convert measurement units to imperial.
-    conversions = {
-        'ml': 0.033814,
-        'cl': 0.33814,
-        'l': 33.814,
-        'oz': 1,
-        'cup': 0.00422675,
-        'lb': 0.00220462
-    }
-    try:
-        if measurement:
-            parts = measurement.split()
-            if len(parts) == 2:
-                amount, unit = parts
-            elif len(parts) == 3 and parts[1] in ["to", "taste"]:
-                return measurement
-            else:
-                amount = parts[0]
-                unit = parts[-1]
+    return convert_measure(measurement, 'imperial')
 
-            amount = float(Fraction(amount))
-            if unit in conversions:
-                return f"{amount * conversions[unit]:.2f} oz"
-    except (ValueError, AttributeError):
-        return measurement
-    return measurement
+def set_drinks(drinks):
+    ## Reload the catalog once the bootstrap finished. It wrote the drinks to data/default.csv,
+    ## the 'default' local source, so load_catalog imports them from there like any edit of
+    ## that file, instead of writing them to the database twice.
+    with _catalog_lock:
+        load_catalog()
+        reload_recommender()
 
+@metrics.timed('initialize_drinks')
 def initialize_drinks():
-    ## Initialize drinks by fetching them from the API if not already available.
-    if app.config["DRINKS_DF"] is None or app.config["DRINKS_DF"].empty:
-        drinks = []
-        for letter in 'abcdefghijklmnopqrstuvwxyz':
-            drinks.extend(fetch_drinks_by_letter(letter))
-        app.config["DRINKS_DF"] = pd.DataFrame(drinks, columns=['idDrink', 'strDrink', 'strCategory', 'strDrinkThumb'])
-        save_drinks(app.config["DRINKS_DF"])
-
-@app.route('/')
+    ## Start the catalog bootstrap in the background if no drinks from TheCocktailDB are available yet.
+    ## The bootstrap can also be run up front with `python bootstrap.py`.
+    if current_app.config["STORE"].count_drinks(UPSTREAM_SOURCE) == 0:
+        import bootstrap
+        bootstrap.start_background_bootstrap(in_app_context(current_app._get_current_object(), set_drinks))
+
+def page_key():
+    ## Route, arguments and the version of the data a page is rendered from. The recipes
+    ## version moves on every save, rating and created recipe, in any worker (see
+    ## sync_recipes), and the day is there for the drink of the day.
+    config = current_app.config
+    return (request.endpoint, tuple(sorted((request.view_args or {}).items())),
+            tuple(sorted(request.args.items(multi=True))),
+            config["CATALOG_VERSION"], config["RECIPES_VERSION"], config["RECOMMENDER_VERSION"], date.today())
+
+def cached_page(view):
+    ## Serve GET requests for a page from the page cache, with a strong ETag, and answer
+    ## If-None-Match with a 304 without rendering. Other methods render as usual.
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+        cache = current_app.config["PAGE_CACHE"]
+        key = page_key()
+        cached = cache.get(request.endpoint, key)
+        if cached is not None:
+            g.page_cache = 'hit'
+            etag, body, mimetype = cached
+        else:
+            g.page_cache = 'miss'
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            ## A streamed page is rendered in full here so it can be stored and hashed
+            body, mimetype = response.get_data(), response.mimetype
+            etag = cache.put(key, body, mimetype)
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = current_app.config["PAGE_CACHE_CONTROL"]
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            cache.count_not_modified()
+        return response
+    return wrapper
+
+@route('/')
+@cached_page
 def home():
-    initialize_drinks()
     categories = fetch_categories_with_drinks()
-    print(f"Categories: {categories}")
-    drink_of_the_day = get_random_drink()
+    log.payload('Categories', categories=categories)
+    drink_of_the_day = get_drink_of_the_day()
     return render_template('home.html', categories=categories, drink_of_the_day=drink_of_the_day)
 
-@app.route('/category/<category_name>')
-def category(category_name):
+def render_streamed(template_name, **context):
+    ## Render a template as a stream so the first bytes go out before the whole list is rendered.
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(8)
+    return Response(stream_with_context(timed_stream(stream, f'render:{template_name}')))
+
+def timed_stream(stream, stage):
+    started = time.perf_counter()
+    try:
+        yield from stream
+    finally:
+        metrics.STAGE_LATENCY.observe(time.perf_counter() - started, stage=stage)
+
+def page_url(page):
+    ## URL of another page of the current listing, keeping the other query arguments.
+    args = request.args.to_dict()
+    args['page'] = page
+    return url_for(request.endpoint, **request.view_args, **args)
+
+def page_links(pagination):
+    ## Add the previous/next page URLs to a pagination dict.
+    pagination['prev_url'] = page_url(pagination['page'] - 1) if pagination['has_prev'] else None
+    pagination['next_url'] = page_url(pagination['page'] + 1) if pagination['has_next'] else None
+    return pagination
+
+def drink_summary(drink):
+    ## The fields a drink listing needs, with missing values as None so they serialize to JSON.
+    summary = {}
+    for key in ('idDrink', 'strDrink', 'strDrinkThumb', 'strCategory', 'strAlcoholic'):
+        value = drink.get(key)
+        summary[key] = None if isinstance(value, float) and math.isnan(value) else value
+    if summary['idDrink'] is not None:
+        summary['idDrink'] = str(summary['idDrink'])
+    return summary
+
+def category_drinks(category_name):
     ## Convert underscores back to spaces
     category_name = category_name.replace('_', ' ')
-    print(f"Category name received: {category_name}")
-    
     drinks = fetch_drinks_by_category(category_name)
-    print(f"Drinks fetched: {drinks}")
-    
+    log.debug('Drinks fetched', category=category_name, drinks=len(drinks))
+    return category_name, drinks
+
+@route('/category/<category_name>')
+@cached_page
+def category(category_name):
+    category_name, drinks = category_drinks(category_name)
+
     if not drinks:
-        return render_template('not_found.html')
-    
-    return render_template('category.html', category=category_name, drinks=drinks)
+        return render_template('not_found.html'), 404
+
+    page, per_page = page_args(request.args)
+    drinks, pagination = paginate(drinks, page, per_page)
+    return render_streamed('category.html', category=category_name, drinks=drinks, pagination=page_links(pagination))
 
-@app.route('/recipe/<drink_id>', methods=['GET', 'POST'])
+@route('/api/category/<category_name>')
+def api_category(category_name):
+    ## JSON variant of the category page, one page at a time.
+    category_name, drinks = category_drinks(category_name)
+    page, per_page = page_args(request.args)
+    drinks, pagination = paginate(drinks, page, per_page)
+    return jsonify(category=category_name, drinks=[drink_summary(d) for d in drinks], **page_links(pagination))
+
+@route('/recipe/<drink_id>', methods=['GET', 'POST'])
+@cached_page
 def recipe(drink_id):
     details = fetch_drink_details(drink_id)
     if details is None:
-        return render_template('not_found.html')
+        return render_template('not_found.html'), 404
 
-    is_saved = any(d['idDrink'] == drink_id for d in app.config["SAVED_RECIPES"])
+    is_saved = current_app.config["RECIPES"].status(drink_id) == 'saved'
     recipe_saved = False
     notes = details.get('notes', "")
     rating = details.get('rating', None)
@@ -279,84 +728,173 @@ def recipe(drink_id):
             notes = request.form.get('notes')
             rating = request.form.get('rating')
             if rating:
-                rating = int(rating)
+                try:
+                    rating = check_rating(rating)
+                except ValueError as e:
+                    abort(400, str(e))
             save_recipe(details, notes, rating)
             recipe_saved = True
             return redirect(url_for('recipe', drink_id=drink_id, saved='true'))
 
+        ## Convert a copy so the stored recipe keeps its original units
         unit = request.form.get('unit')
-        if unit == 'metric':
-            for i in range(1, 16):
-                measure_key = f'strMeasure{i}'
-                if details.get(measure_key):
-                    details[measure_key] = convert_to_metric(details[measure_key])
-        else:
-            for i in range(1, 16):
-                measure_key = f'strMeasure{i}'
-                if details.get(measure_key):
-                    details[measure_key] = convert_to_imperial(details[measure_key])
+        details = convert_recipe(details, 'metric' if unit == 'metric' else 'imperial')
 
     recipe_saved = request.args.get('saved') == 'true'
 
-    return render_template('recipe.html', details=details, is_saved=is_saved, recipe_saved=recipe_saved, notes=notes, rating=rating)
+    return render_template('recipe.html', details=details, is_saved=is_saved, recipe_saved=recipe_saved, notes=notes, rating=rating,
+                           similar=similar_drinks(drink_id))
+
+@route('/api/similar/<drink_id>')
+def api_similar(drink_id):
+    ## JSON list of the drinks most similar to one, with their cosine similarity.
+    limit = current_app.config["SIMILAR_DRINKS"]
+    limit = max(1, min(request.args.get('limit', limit, type=int), limit))
+    drinks = [dict(drink_summary(drink), similarity=round(score, 4)) for drink, score in similar_drinks(drink_id, limit)]
+    return jsonify(idDrink=str(drink_id), drinks=drinks)
 
-@app.route('/rate_recipe', methods=['POST'])
+@route('/rate_recipe', methods=['POST'])
 def rate_recipe():
     data = request.json
     drink_id = data['idDrink']
-    rating = int(data['rating'])
+    try:
+        rating = check_rating(data.get('rating'))
+    except ValueError as e:
+        return jsonify(success=False, error=str(e)), 400
 
-    for recipe in app.config["SAVED_RECIPES"]:
-        if recipe['idDrink'] == drink_id:
-            recipe['rating'] = rating
-            break
+    store = current_app.config["STORE"]
+    recipe = current_app.config["RECIPES"].get(drink_id)
+    if recipe is not None:
+        recipe['rating'] = rating
+        store.set_rating(drink_id, rating)
     else:
-        for recipe in app.config["DRINKS_DF"].to_dict('records'):
-            if recipe['idDrink'] == drink_id:
-                recipe['rating'] = rating
-                app.config["SAVED_RECIPES"].append(recipe)
-                break
+        recipe = store.get_drink(drink_id)
+        if recipe is not None:
+            recipe['rating'] = rating
+            current_app.config["RECIPES"].put(recipe, 'saved')
+            store.save_recipe(recipe, 'saved')
 
-    save_drinks(app.config["DRINKS_DF"])
     return jsonify({"success": True})
 
-@app.route('/saved_recipes')
+@route('/api/ratings', methods=['POST'])
+def api_ratings():
+    ## Add many ratings at once: NDJSON lines {"idDrink": ..., "rating": 1-5}, or a JSON array.
+    ## They count towards the rating aggregates only; nothing is saved to the user's recipes.
+    request.max_content_length = current_app.config["BATCH_MAX_BYTES"]
+    try:
+        ratings = [parse_rating(line, item) for line, item in read_items(request.stream, request.mimetype)]
+    except BatchError as e:
+        return jsonify(error=e.message, line=e.line), 400
+    drinks = current_app.config["STORE"].add_ratings(ratings)
+    return jsonify(ratings=len(ratings), drinks=drinks)
+
+@route('/api/ratings/top')
+def api_top_rated():
+    ## The best rated drinks with their number of ratings and mean, best first.
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    min_count = max(1, request.args.get('min_count', 1, type=int))
+    drinks = []
+    for drink_id, count, mean in current_app.config["STORE"].top_rated(limit, min_count):
+        drink = current_app.config["CATALOG"].get(drink_id) or current_app.config["RECIPES"].get(drink_id)
+        summary = drink_summary(drink) if drink is not None else {'idDrink': drink_id}
+        drinks.append(dict(summary, rating_count=count, rating_mean=round(mean, 3)))
+    return jsonify(drinks=drinks)
+
+@route('/api/ratings/<drink_id>')
+def api_rating(drink_id):
+    return jsonify(idDrink=str(drink_id), **current_app.config["STORE"].rating_stats(drink_id))
+
+@route('/api/recipes', methods=['POST'])
+def api_recipes():
+    ## Save or create many recipes at once, as NDJSON or a JSON array of drink records with
+    ## an optional "kind" ('saved' or 'created'); the format of /api/recipes/export.
+    request.max_content_length = current_app.config["BATCH_MAX_BYTES"]
+    taken = set()
+    def new_id():
+        drink_id = new_recipe_id(taken)
+        taken.add(drink_id)
+        return drink_id
+    recipes, kinds = [], {}
+    try:
+        for line, item in read_items(request.stream, request.mimetype):
+            record, kind = parse_recipe(line, item, new_id)
+            drink_id = str(record['idDrink'])
+            ## An item may update a recipe of its own kind, but a created recipe must not
+            ## overwrite a catalog drink or a saved recipe, nor a saved one a created recipe
+            stored = kinds.get(drink_id) or current_app.config["RECIPES"].status(drink_id)
+            if kind == 'created' and drink_id in current_app.config["CATALOG"]:
+                raise BatchError(line, f'idDrink {drink_id} is a catalog drink')
+            if stored not in (None, kind):
+                raise BatchError(line, f'idDrink {drink_id} is a {stored} recipe')
+            kinds[drink_id] = kind
+            recipes.append((record, kind))
+    except BatchError as e:
+        return jsonify(error=e.message, line=e.line), 400
+    current_app.config["STORE"].save_recipes(recipes)
+    reload_recipes()
+    counts = {status: sum(1 for _, kind in recipes if kind == status) for status in STATUSES}
+    return jsonify(recipes=len(recipes), ids=[record['idDrink'] for record, _ in recipes], **counts)
+
+@route('/api/recipes/export')
+def api_recipes_export():
+    ## Stream the stored recipes as NDJSON, one recipe per line with its kind, notes and rating.
+    kind = request.args.get('kind')
+    if kind is not None and kind not in STATUSES:
+        return jsonify(error=f'kind must be one of {", ".join(STATUSES)}'), 400
+    lines = write_items(current_app.config["STORE"].iter_recipes(kind))
+    return Response(timed_stream(lines, 'export:recipes'), mimetype=NDJSON_MIMETYPE,
+                    headers={'Content-Disposition': 'attachment; filename=recipes.ndjson'})
+
+@route('/saved_recipes')
 def saved_recipes():
-    if not app.config["SAVED_RECIPES"]:
+    saved = current_app.config["RECIPES"].by_status('saved')
+    if not saved:
         return render_template('no_saved_recipes.html')
-    return render_template('saved_recipes.html', saved_recipes=app.config["SAVED_RECIPES"])
+    return render_template('saved_recipes.html', saved_recipes=saved)
 
-@app.route('/created_recipes')
+@route('/created_recipes')
 def created_recipes():
-    if not app.config["CREATED_RECIPES"]:
+    created = current_app.config["RECIPES"].by_status('created')
+    if not created:
         return render_template('no_saved_recipes.html')
-    return render_template('created_recipes.html', saved_recipes=app.config["CREATED_RECIPES"])
+    return render_template('created_recipes.html', saved_recipes=created)
 
-@app.route('/search', methods=['GET'])
-def search():
-    query = request.args.get('query')
-    ingredient = request.args.get('ingredient')
-    alcoholic = request.args.get('alcoholic')
-    
-    drinks = []
+def find_drinks(args):
+    ## Look up the drinks for the search arguments. Returns a sequence that can be sliced into pages.
+    query = args.get('query')
+    ingredient = args.get('ingredient')
+    alcoholic = args.get('alcoholic')
 
     if query and len(query) == 1:
-        drinks = fetch_drinks_by_letter(query)
+        return search_drinks_by_letter(query)
     elif query:
-        drinks = fetch_drinks_by_name(query)
+        return fetch_drinks_by_name(query)
     elif ingredient:
-        drinks = fetch_drinks_by_ingredient(ingredient)
+        return search_drinks_by_ingredient(ingredient, args.get('match', 'all'))
     elif alcoholic:
-        drinks = fetch_drinks_by_alcoholic(alcoholic)
-    else:
-        drinks = app.config["DRINKS_DF"].to_dict('records')
-    
-    if not drinks:
+        return fetch_drinks_by_alcoholic(alcoholic)
+    ## Without a filter list the whole catalog; only the rows of the requested page are read
+    return current_app.config["CATALOG"]
+
+@route('/search', methods=['GET'])
+def search():
+    drinks = find_drinks(request.args)
+
+    if not len(drinks):
         return render_template('not_found.html')
-    
-    return render_template('search_results.html', drinks=drinks)
 
-@app.route('/create_recipe', methods=['GET', 'POST'])
+    page, per_page = page_args(request.args)
+    drinks, pagination = paginate(drinks, page, per_page)
+    return render_streamed('search_results.html', drinks=drinks, pagination=page_links(pagination))
+
+@route('/api/search', methods=['GET'])
+def api_search():
+    ## JSON variant of the search page, one page at a time.
+    page, per_page = page_args(request.args)
+    drinks, pagination = paginate(find_drinks(request.args), page, per_page)
+    return jsonify(drinks=[drink_summary(d) for d in drinks], **page_links(pagination))
+
+@route('/create_recipe', methods=['GET', 'POST'])
 def create_recipe():
     categories = fetch_categories_with_drinks()
     if request.method == 'POST':
@@ -365,18 +903,19 @@ def create_recipe():
         alcoholic = request.form.get('alcoholic')
         instructions = request.form.get('instructions')
 
-        ## Handle file upload
-        file = request.files['drink_image']
-        if file:
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+        ## Handle file upload; images are stored under their content hash
+        file = request.files.get('drink_image')
+        if file and file.filename:
+            try:
+                filename = current_app.config["UPLOADS"].store(file)
+            except UploadError as e:
+                return render_template('create_recipe.html', categories=[c['name'] for c in categories if c['has_drinks']], error=str(e)), 400
             strDrinkThumb = url_for('static', filename=f'uploads/{filename}', _external=True)
         else:
             strDrinkThumb = ''
 
         new_recipe = {
-            'idDrink': str(random.randint(100000, 999999)),  ## Generate a random ID
+            'idDrink': new_recipe_id(),
             'strDrink': drink_name,
             'strCategory': 'Created Recipes',
             'strAlcoholic': alcoholic,
@@ -398,25 +937,95 @@ def create_recipe():
                 new_recipe[f'strIngredient{i}'] = None
                 new_recipe[f'strMeasure{i}'] = None
 
-        app.config["CREATED_RECIPES"].append(new_recipe)
+        current_app.config["RECIPES"].put(new_recipe, 'created')
+        current_app.config["STORE"].save_recipe(new_recipe, 'created')
+        update_created_recipes_count()
+        index_drink(new_recipe)
         return redirect(url_for('created_recipes'))
 
     return render_template('create_recipe.html', categories=[c['name'] for c in categories if c['has_drinks']])
 
+def new_recipe_id(taken=()):
+    ## A random id for a created recipe that no recipe uses yet.
+    while True:
+        drink_id = str(random.randint(100000, 999999))
+        if drink_id not in current_app.config["RECIPES"] and drink_id not in current_app.config["CATALOG"] and drink_id not in taken:
+            return drink_id
+
 def save_recipe(details, notes, rating=None):
     ## Save a recipe to the appropriate category
     details['saved_date'] = datetime.now().strftime('%B %d, %Y at %I:%M %p')
     details['notes'] = notes
     details['rating'] = rating
-    if details['strCategory'] == 'Created Recipes':
-        app.config["CREATED_RECIPES"].append(details)
-    else:
-        app.config["SAVED_RECIPES"].append(details)
+    ## Saving the same drink again replaces the earlier copy
+    status = 'created' if details['strCategory'] == 'Created Recipes' else 'saved'
+    current_app.config["RECIPES"].put(details, status)
+    current_app.config["STORE"].save_recipe(details, status)
+    if status == 'created':
+        update_created_recipes_count()
+
+def collect_app_metrics(app):
+    ## Catalog size and the hit counters of the caches in front of TheCocktailDB, read on every scrape.
+    recipes = app.config["RECIPES"]
+    samples = [
+        ('cafecopycat_catalog_drinks', 'gauge', 'Drinks in the catalog.', len(app.config["CATALOG"])),
+        ('cafecopycat_recipes', 'gauge', 'Saved and created recipes.',
+         [({'status': status}, recipes.count(status)) for status in ('saved', 'created')]),
+        ('cafecopycat_ready', 'gauge', 'Whether the warmup has finished.', int(app.config["WARMUP"].ready)),
+    ]
+    page_cache = app.config["PAGE_CACHE"]
+    samples += metrics.stats_samples('cafecopycat_page_cache', 'Rendered page cache', page_cache.stats(),
+                                     counters=('hits', 'misses', 'not_modified', 'evictions'), gauges=('size', 'hit_ratio'))
+    samples.append(('cafecopycat_page_cache_lookups_total', 'counter', 'Rendered page cache lookups by route.',
+                    [({'route': route, 'result': result}, counts[result])
+                     for route, counts in sorted(page_cache.route_stats().items()) for result in ('hits', 'misses')]))
+    samples += metrics.stats_samples('cafecopycat_detail_cache', 'Drink detail cache', app.config["DETAIL_CACHE"].stats(),
+                                     counters=('hits', 'misses', 'negative_hits', 'disk_hits', 'evictions'),
+                                     gauges=('size', 'hit_ratio'))
+    ## The API client is only reported once something has imported it
+    cocktail_api = sys.modules.get('cocktail_api')
+    mirror = cocktail_api.get_mirror() if cocktail_api else None
+    if mirror is not None:
+        stats = mirror.stats()
+        lookups = stats['fresh_hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['fresh_hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        samples += metrics.stats_samples('cafecopycat_mirror', 'API mirror', stats,
+                                         counters=('fresh_hits', 'stale_hits', 'misses', 'fallbacks'),
+                                         gauges=('entries', 'hit_ratio'))
+    if cocktail_api is not None:
+        samples += metrics.stats_samples('cafecopycat_singleflight', 'Coalesced API calls', cocktail_api.singleflight.stats(),
+                                         counters=('calls', 'executions', 'coalesced', 'timeouts'), gauges=('in_flight',))
+    samples += metrics.stats_samples('cafecopycat_log', 'Payload logs', applog.stats(),
+                                     counters=('payload_kept', 'payload_dropped'))
+    return samples
+
+@route('/metrics')
+def metrics_endpoint():
+    ## Prometheus scrape endpoint
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+@route('/ready')
+def ready():
+    ## Readiness probe: 200 once the catalog and recipes are loaded, 503 while the warmup runs.
+    status = current_app.config["WARMUP"].status()
+    status['drinks'] = len(current_app.config["CATALOG"])
+    return jsonify(status), 200 if status['ready'] else 503
 
 ## Error handler for 404 errors
-@app.errorhandler(404)
 def page_not_found(e):
     return render_template('not_found.html'), 404
 
+_app_lock = threading.Lock()
+
+def __getattr__(name):
+    ## `main.app` is created on first use, so importing main doesn't build an app by itself.
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if 'app' not in globals():
+            globals()['app'] = create_app()
+    return globals()['app']
+
 if __name__ == '__main__':
+    app = create_app()
     app.run(debug=True, port=5001)
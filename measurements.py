@@ -0,0 +1,136 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+## Measurement parsing and unit conversion for recipe ingredients.
+## Every distinct measure string ("1 1/2 oz", "2-3 cl", "1 tsp") is parsed once into
+## a Measure (amount range + unit) and cached, and so is each converted variant, so
+## toggling a recipe between metric and imperial is a dictionary lookup per measure.
+
+Measure = namedtuple('Measure', ['low', 'high', 'unit', 'rest'])
+
+## Canonical unit -> (system, millilitres per unit). 'part' has no fixed size.
+UNITS = {
+    'ml': ('metric', 1.0),
+    'cl': ('metric', 10.0),
+    'l': ('metric', 1000.0),
+    'oz': ('imperial', 29.5735),
+    'tsp': ('imperial', 4.92892),
+    'tbsp': ('imperial', 14.7868),
+    'dash': ('imperial', 0.92),
+    'shot': ('imperial', 44.3603),
+    'jigger': ('imperial', 44.3603),
+    'cup': ('imperial', 236.588),
+    'pint': ('imperial', 473.176),
+    ## A weight, converted as the earlier converter did: 1 lb of a drink ingredient as 453.592 ml
+    'lb': ('imperial', 453.592),
+    'part': (None, None),
+}
+
+UNIT_ALIASES = {
+    'ml': 'ml', 'milliliter': 'ml', 'milliliters': 'ml', 'millilitre': 'ml', 'millilitres': 'ml',
+    'cl': 'cl', 'centiliter': 'cl', 'centiliters': 'cl', 'centilitre': 'cl', 'centilitres': 'cl',
+    'l': 'l', 'liter': 'l', 'liters': 'l', 'litre': 'l', 'litres': 'l',
+    'oz': 'oz', 'fl oz': 'oz', 'ounce': 'oz', 'ounces': 'oz',
+    'tsp': 'tsp', 'teaspoon': 'tsp', 'teaspoons': 'tsp',
+    'tbsp': 'tbsp', 'tblsp': 'tbsp', 'tbl': 'tbsp', 'tablespoon': 'tbsp', 'tablespoons': 'tbsp',
+    'dash': 'dash', 'dashes': 'dash',
+    'shot': 'shot', 'shots': 'shot',
+    'jigger': 'jigger', 'jiggers': 'jigger',
+    'cup': 'cup', 'cups': 'cup',
+    'pint': 'pint', 'pints': 'pint',
+    'lb': 'lb', 'lbs': 'lb', 'pound': 'lb', 'pounds': 'lb',
+    'part': 'part', 'parts': 'part',
+}
+
+UNICODE_FRACTIONS = {'½': 0.5, '¼': 0.25, '¾': 0.75, '⅓': 1 / 3, '⅔': 2 / 3, '⅛': 0.125}
+
+AMOUNT = r'\d+\s+\d+/\d+|\d+/\d+|\d*[½¼¾⅓⅔⅛]|\d+(?:\.\d+)?|\.\d+'
+MEASURE_RE = re.compile(
+    rf'^\s*(?P<low>{AMOUNT})(?:\s*(?:-|–|to)\s*(?P<high>{AMOUNT}))?\s*(?P<tail>.*?)\s*$',
+    re.IGNORECASE)
+
+def parse_amount(text):
+    ## Turn "1 1/2", "3/4", "1½" or "0.5" into a float.
+    text = text.strip()
+    total = 0.0
+    for part in text.split():
+        if part[-1] in UNICODE_FRACTIONS:
+            total += UNICODE_FRACTIONS[part[-1]] + (float(part[:-1]) if part[:-1] else 0.0)
+        elif '/' in part:
+            numerator, denominator = part.split('/')
+            total += float(numerator) / float(denominator)
+        else:
+            total += float(part)
+    return total
+
+@lru_cache(maxsize=4096)
+def parse_measure(text):
+    ## Parse a measure string into a Measure, or return None if it has no amount
+    ## or unit we understand (e.g. "to taste", "Juice of 1").
+    if not isinstance(text, str):
+        return None
+    match = MEASURE_RE.match(text)
+    if not match:
+        return None
+    try:
+        low = parse_amount(match.group('low'))
+        high = parse_amount(match.group('high')) if match.group('high') else None
+    except (ValueError, ZeroDivisionError):
+        return None
+
+    words = match.group('tail').split()
+    for size in (2, 1):
+        if len(words) >= size:
+            unit = UNIT_ALIASES.get(' '.join(words[:size]).lower().rstrip('.'))
+            if unit:
+                return Measure(low, high, unit, ' '.join(words[size:]))
+    return None
+
+def format_amount(measure, factor):
+    amount = f"{measure.low * factor:.2f}"
+    if measure.high is not None:
+        amount += f"-{measure.high * factor:.2f}"
+    return amount
+
+@lru_cache(maxsize=8192)
+def convert_measure(text, system):
+    ## Convert a measure string to 'metric' (ml) or 'imperial' (oz). Measures already in
+    ## the target system, 'parts' and anything unparseable come back unchanged.
+    measure = parse_measure(text)
+    if measure is None:
+        return text
+    unit_system, ml_per_unit = UNITS[measure.unit]
+    if unit_system is None or unit_system == system:
+        return text
+    if system == 'metric':
+        converted = f"{format_amount(measure, ml_per_unit)} ml"
+    else:
+        converted = f"{format_amount(measure, ml_per_unit / UNITS['oz'][1])} oz"
+    return f"{converted} {measure.rest}" if measure.rest else converted
+
+def convert_recipe(details, system):
+    ## Return a copy of a recipe with strMeasure1..15 converted to the given system.
+    converted = dict(details)
+    for i in range(1, 16):
+        measure = details.get(f'strMeasure{i}')
+        if measure:
+            converted[f'strMeasure{i}'] = convert_measure(measure, system)
+    return converted
+
+def convert_recipes(recipes, system):
+    ## Convert a batch of recipes in one pass: every distinct measure string in the
+    ## batch is converted once and the results are shared between recipes.
+    keys = [f'strMeasure{i}' for i in range(1, 16)]
+    distinct = {recipe.get(key) for recipe in recipes for key in keys}
+    distinct.discard(None)
+    distinct.discard('')
+    table = {measure: convert_measure(measure, system) for measure in distinct}
+    converted = []
+    for recipe in recipes:
+        copy = dict(recipe)
+        for key in keys:
+            if copy.get(key):
+                copy[key] = table[copy[key]]
+        converted.append(copy)
+    return converted
@@ -0,0 +1,162 @@
+import bisect
+import threading
+import time
+from functools import wraps
+
+## In-process metrics in the Prometheus text format, without extra dependencies.
+## Counters and latency histograms are updated by the request and upstream hooks;
+## anything that already keeps its own counters (caches, the mirror, the catalog)
+## is read through a collector function when /metrics is scraped.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                     for key, value in labels)
+    return '{' + pairs + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.labelnames), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{format_labels(zip(self.labelnames, key))} {format_value(value)}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        ## label values -> [count per bucket (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(name, '') for name in self.labelnames))
+        return series[2] if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._series.items()):
+                labels = list(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{format_labels(labels + [("le", format_value(bound))])} {cumulative}')
+                lines.append(f'{self.name}_sum{format_labels(labels)} {total!r}')
+                lines.append(f'{self.name}_count{format_labels(labels)} {count}')
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collect, name=None):
+        ## collect() returns (name, type, help, value) or (name, type, help, [(labels dict, value), ...])
+        ## tuples, read fresh on every scrape. type is 'gauge' or 'counter'. A collector added
+        ## under the name of an earlier one replaces it.
+        with self._lock:
+            self._collectors[name or collect.__name__] = collect
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        for collect in list(self._collectors.values()):
+            try:
+                samples = collect()
+            except Exception as e:
+                lines.append(f'# collector {getattr(collect, "__name__", collect)} failed: {e}')
+                continue
+            for name, metric_type, help, value in samples:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                series = value if isinstance(value, list) else [({}, value)]
+                for labels, sample in series:
+                    lines.append(f'{name}{format_labels(sorted(labels.items()))} {format_value(sample)}')
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_LATENCY = REGISTRY.histogram('cafecopycat_request_duration_seconds',
+                                     'Time spent serving a request, including streamed bodies.',
+                                     ('route', 'method', 'status'))
+STAGE_LATENCY = REGISTRY.histogram('cafecopycat_stage_duration_seconds',
+                                   'Time spent in a step of a request, such as a data fetch or a template render.',
+                                   ('stage',))
+UPSTREAM_LATENCY = REGISTRY.histogram('cafecopycat_upstream_duration_seconds',
+                                      'Time spent on a call to TheCocktailDB.', ('endpoint', 'status'))
+UPSTREAM_BYTES = REGISTRY.counter('cafecopycat_upstream_response_bytes_total',
+                                  'Bytes received from TheCocktailDB.', ('endpoint',))
+
+def timed(stage):
+    ## Decorator that records how long a function takes under the given stage name.
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STAGE_LATENCY.observe(time.perf_counter() - started, stage=stage)
+        return wrapper
+    return decorate
+
+def stats_samples(prefix, help, stats, counters=(), gauges=()):
+    ## Turn a stats() dict into collector samples: the named counters and gauges.
+    samples = []
+    for key in counters:
+        samples.append((f'{prefix}_{key}_total', 'counter', f'{help}: {key.replace("_", " ")}.', stats[key]))
+    for key in gauges:
+        samples.append((f'{prefix}_{key}', 'gauge', f'{help}: {key.replace("_", " ")}.', float(stats[key])))
+    return samples
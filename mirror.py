@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+import requests
+import applog
+
+## Local mirror of TheCocktailDB responses (list, filter, search and lookup).
+## Every successful response is written to a sqlite file. Fresh entries are served
+## straight from disk; stale ones are served immediately too while a background
+## thread fetches a new copy (stale-while-revalidate). When the API is down the
+## last good copy keeps the site working, and in offline mode the mirror never goes
+## upstream at all, which also makes a pinned snapshot usable as test fixtures.
+
+log = applog.get_logger('mirror')
+
+class MirrorMiss(requests.exceptions.ConnectionError):
+    ## Raised in offline mode for a response that was never recorded.
+    pass
+
+def mirror_key(endpoint, params=None):
+    return f"{endpoint}?{urlencode(sorted((params or {}).items()))}"
+
+class Mirror:
+    def __init__(self, path, ttl=6 * 3600, offline=False, workers=2):
+        self.path = path
+        self.ttl = ttl
+        self.offline = offline
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mirror-refresh')
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body TEXT NOT NULL, fetched_at REAL NOT NULL)')
+        self._conn.commit()
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    def fetch(self, endpoint, params, fetch_json, record=True):
+        ## Return the JSON for an API call, using fetch_json(endpoint, params) to go upstream.
+        ## With record=False a response that isn't mirrored yet is returned without adding it.
+        key = mirror_key(endpoint, params)
+        entry = self._read(key)
+        if entry is not None:
+            body, fetched_at = entry
+            if self.offline or time.time() - fetched_at < self.ttl:
+                self._count('fresh_hits')
+                return body
+            self._count('stale_hits')
+            self._refresh_async(key, endpoint, params, fetch_json)
+            return body
+
+        if self.offline:
+            self._count('misses')
+            raise MirrorMiss(f"{key} is not in the offline mirror {self.path}")
+        self._count('misses')
+        body = fetch_json(endpoint, params)
+        if record:
+            self._write(key, body)
+        return body
+
+    def pin(self, offline=True):
+        ## Stop (or resume) going upstream and serve only what the mirror holds.
+        self.offline = offline
+
+    def snapshot(self, dest_path):
+        ## Copy the mirror to dest_path, e.g. to pin it for an offline deployment or a test run.
+        dest = sqlite3.connect(dest_path)
+        with self._lock:
+            self._conn.backup(dest)
+        dest.close()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            return {'entries': entries, 'fresh_hits': self.fresh_hits, 'stale_hits': self.stale_hits,
+                    'misses': self.misses, 'fallbacks': self.fallbacks, 'offline': self.offline}
+
+    def _refresh_async(self, key, endpoint, params, fetch_json):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._executor.submit(self._refresh, key, endpoint, params, fetch_json)
+
+    def _refresh(self, key, endpoint, params, fetch_json):
+        try:
+            self._write(key, fetch_json(endpoint, params))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            ## Keep serving the stale copy until the API answers again
+            self._count('fallbacks')
+            log.warning('Mirror refresh failed', key=key, error=str(e))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _read(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT body, fetched_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _write(self, key, body):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO responses (key, body, fetched_at) VALUES (?, ?, ?)',
+                               (key, json.dumps(body), time.time()))
+            self._conn.commit()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+if __name__ == '__main__':
+    import cocktail_api
+
+    parser = argparse.ArgumentParser(description='Manage the local mirror of TheCocktailDB.')
+    parser.add_argument('command', choices=['warm', 'snapshot', 'stats'],
+                        help='warm: record categories, category listings and letter searches; '
+                             'snapshot: copy the mirror to a file that can be pinned; stats: show entry counts')
+    parser.add_argument('dest', nargs='?', help='destination file for snapshot')
+    args = parser.parse_args()
+    applog.setup_logging()
+    mirror = cocktail_api.get_mirror()
+    if mirror is None:
+        raise SystemExit('The mirror is disabled (COCKTAILDB_MIRROR_PATH is empty).')
+
+    if args.command == 'warm':
+        categories = cocktail_api.get_json('list.php', {'c': 'list'}).get('drinks') or []
+        names = [c['strCategory'] for c in categories]
+        cocktail_api.map_concurrent(lambda name: cocktail_api.get_json('filter.php', {'c': name}), names)
+        cocktail_api.map_concurrent(lambda letter: cocktail_api.get_json('search.php', {'f': letter}), 'abcdefghijklmnopqrstuvwxyz')
+        for alcoholic in ('Alcoholic', 'Non_Alcoholic'):
+            cocktail_api.get_json('filter.php', {'a': alcoholic})
+        print(mirror.stats())
+    elif args.command == 'snapshot':
+        if not args.dest:
+            raise SystemExit('Usage: python mirror.py snapshot <dest.sqlite>')
+        mirror.snapshot(args.dest)
+        print(f"Mirror copied to {args.dest}. Run with COCKTAILDB_MIRROR_PATH={args.dest} COCKTAILDB_OFFLINE=1 to pin it.")
+    else:
+        print(mirror.stats())
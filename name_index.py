@@ -0,0 +1,164 @@
+import bisect
+import threading
+
+## Name index for drink searches, covering the catalog and the created recipes.
+## A sorted array of normalized names answers prefix and first-letter queries with
+## a binary search, and an n-gram index (2 and 3 characters) answers substring
+## queries and falls back to similar names when a query has a typo.
+
+SUMMARY_KEYS = ('idDrink', 'strDrink', 'strDrinkThumb', 'strCategory', 'strAlcoholic')
+
+def normalize_name(name):
+    if not isinstance(name, str):
+        return ''
+    return ' '.join(name.lower().split())
+
+def name_grams(name):
+    ## Return the 2 and 3 character substrings of a normalized name.
+    grams = set()
+    for size in (2, 3):
+        for i in range(len(name) - size + 1):
+            grams.add(name[i:i + size])
+    return grams
+
+class NameIndex:
+    def __init__(self, fuzzy_threshold=0.5):
+        self.fuzzy_threshold = fuzzy_threshold
+        self._lock = threading.Lock()
+        self._sorted = []
+        self._names = {}
+        self._grams = {}
+        self._summaries = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getstate__(self):
+        ## Pickled into the catalog snapshot (see snapshot.py) without its lock
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def build(self, drinks):
+        ## Replace the index with the given drink records.
+        with self._lock:
+            self._sorted = []
+            self._names = {}
+            self._grams = {}
+            self._summaries = {}
+            for drink in drinks:
+                self._add(drink, keep_sorted=False)
+            self._sorted.sort()
+
+    def add(self, drink):
+        ## Add or update one drink, e.g. a newly created recipe.
+        with self._lock:
+            self._remove(str(drink['idDrink']))
+            self._add(drink, keep_sorted=True)
+
+    def remove(self, drink_id):
+        with self._lock:
+            self._remove(str(drink_id))
+
+    def prefix(self, query, limit=None):
+        ## Return the drinks whose name starts with query, in name order.
+        query = normalize_name(query)
+        with self._lock:
+            ids = self._prefix_ids(query)
+            if limit is not None:
+                ids = ids[:limit]
+            return [dict(self._summaries[drink_id]) for drink_id in ids]
+
+    def search(self, query, limit=None, fuzzy=True):
+        ## Return the drinks whose name contains query. Names starting with the query
+        ## come first, then names with a word starting with it, then the other matches.
+        ## When nothing contains the query, similar names are returned instead.
+        query = normalize_name(query)
+        if not query:
+            return []
+        with self._lock:
+            if len(query) == 1:
+                ids = self._prefix_ids(query)
+            else:
+                ids = self._substring_ids(query)
+                if not ids and fuzzy:
+                    ids = self._similar_ids(query)
+            if limit is not None:
+                ids = ids[:limit]
+            return [dict(self._summaries[drink_id]) for drink_id in ids]
+
+    def _prefix_ids(self, query):
+        ## Caller must hold the lock.
+        start = bisect.bisect_left(self._sorted, (query, ''))
+        ids = []
+        for name, drink_id in self._sorted[start:]:
+            if not name.startswith(query):
+                break
+            ids.append(drink_id)
+        return ids
+
+    def _substring_ids(self, query):
+        ## Caller must hold the lock. Use the n-grams to narrow the candidates, then check them.
+        grams = name_grams(query[:3]) if len(query) <= 3 else {query[i:i + 3] for i in range(len(query) - 2)}
+        candidate_sets = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+        if not candidate_sets or not candidate_sets[0]:
+            return []
+        candidates = set.intersection(*candidate_sets)
+
+        def rank(drink_id):
+            name = self._names[drink_id]
+            if name.startswith(query):
+                return (0, name)
+            if (' ' + query) in name:
+                return (1, name)
+            return (2, name)
+
+        return sorted((drink_id for drink_id in candidates if query in self._names[drink_id]), key=rank)
+
+    def _similar_ids(self, query):
+        ## Caller must hold the lock. Rank names by the share of the query's 3-grams they contain.
+        grams = {query[i:i + 3] for i in range(len(query) - 2)}
+        if not grams:
+            return []
+        scores = {}
+        for gram in grams:
+            for drink_id in self._grams.get(gram, ()):
+                scores[drink_id] = scores.get(drink_id, 0) + 1
+        matches = [(count / len(grams), drink_id) for drink_id, count in scores.items()
+                   if count / len(grams) >= self.fuzzy_threshold]
+        matches.sort(key=lambda match: (-match[0], self._names[match[1]]))
+        return [drink_id for _, drink_id in matches]
+
+    def _add(self, drink, keep_sorted):
+        drink_id = str(drink['idDrink'])
+        name = normalize_name(drink.get('strDrink'))
+        if not name:
+            return
+        self._names[drink_id] = name
+        self._summaries[drink_id] = {key: drink.get(key) for key in SUMMARY_KEYS}
+        self._summaries[drink_id]['idDrink'] = drink_id
+        if keep_sorted:
+            bisect.insort(self._sorted, (name, drink_id))
+        else:
+            self._sorted.append((name, drink_id))
+        for gram in name_grams(name):
+            self._grams.setdefault(gram, set()).add(drink_id)
+
+    def _remove(self, drink_id):
+        name = self._names.pop(drink_id, None)
+        if name is None:
+            return
+        self._summaries.pop(drink_id, None)
+        position = bisect.bisect_left(self._sorted, (name, drink_id))
+        if position < len(self._sorted) and self._sorted[position] == (name, drink_id):
+            del self._sorted[position]
+        for gram in name_grams(name):
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(drink_id)
+                if not ids:
+                    del self._grams[gram]
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from werkzeug.http import generate_etag
+
+## Bounded TTL + LRU cache of rendered pages.
+## The key is the route, its arguments and a data version (see page_key in main.py), so
+## saving, rating or creating a recipe or reloading the catalog moves every page to a new
+## key instead of having to find and drop the old ones; those age out of the LRU.
+## The TTL covers what the version doesn't track, like the category index refreshing
+## from the API. Each page keeps its strong ETag, a hash of the body, so the same page
+## rendered by another worker or after a version bump has the same ETag and a browser
+## revalidating it still gets a 304.
+
+class PageCache:
+    def __init__(self, maxsize=512, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        ## route -> [hits, misses]
+        self._by_route = {}
+
+    def get(self, route, key):
+        ## Return (etag, body, mimetype) of a cached page, or None.
+        now = time.time()
+        with self._lock:
+            counts = self._by_route.setdefault(route, [0, 0])
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    counts[0] += 1
+                    return entry[1:]
+                del self._entries[key]
+            self.misses += 1
+            counts[1] += 1
+            return None
+
+    def put(self, key, body, mimetype):
+        ## Cache a rendered page. Returns its ETag.
+        etag = generate_etag(body)
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[key] = (time.time() + self.ttl, etag, body, mimetype)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return etag
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        ## Return the hit/miss counters and the current size.
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def route_stats(self):
+        ## Return {route: {'hits': n, 'misses': n}}.
+        with self._lock:
+            return {route: {'hits': hits, 'misses': misses} for route, (hits, misses) in self._by_route.items()}
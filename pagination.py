@@ -0,0 +1,27 @@
+## Offset pagination for the search and category listings.
+## paginate() slices one page out of any sequence that supports len() and slicing,
+## such as a list of drinks or the Catalog.
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+def page_args(args, default_size=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+    ## Read page and per_page from the query string, clamped to sane values.
+    page = args.get('page', 1, type=int) or 1
+    per_page = args.get('per_page', default_size, type=int) or default_size
+    return max(page, 1), min(max(per_page, 1), max_size)
+
+def paginate(items, page, per_page):
+    ## Return the items of one page and a dict describing the page.
+    total = len(items)
+    pages = max((total + per_page - 1) // per_page, 1)
+    start = (page - 1) * per_page
+    page_items = list(items[start:start + per_page])
+    return page_items, {
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': pages,
+        'has_prev': page > 1,
+        'has_next': start + per_page < total,
+    }
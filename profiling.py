@@ -0,0 +1,54 @@
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+
+## Opt-in profiling of sampled requests.
+## With PROFILE_SAMPLE_RATE > 0 a random share of requests runs under cProfile and
+## the profile is written to PROFILE_DIR as <milliseconds>-<route>.prof. Open one with
+## `python -m pstats file.prof`, or turn it into a flame graph with a viewer such as
+## snakeviz or flameprof. Only one request is profiled at a time.
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join('data', 'profiles'))
+
+class RequestProfiler:
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, directory=PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self._busy = threading.Lock()
+        self.written = 0
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def start(self):
+        ## Return a running profiler if this request is sampled, otherwise None.
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            ## Another profiler is already running in this process
+            self._busy.release()
+            return None
+        return profile
+
+    def stop(self, profile, route):
+        ## Stop a profiler returned by start() and write its stats. Returns the file path.
+        try:
+            profile.disable()
+            os.makedirs(self.directory, exist_ok=True)
+            name = re.sub(r'[^A-Za-z0-9_.-]', '_', route or 'unknown')
+            path = os.path.join(self.directory, f'{int(time.time() * 1000)}-{name}.prof')
+            profile.dump_stats(path)
+            self.written += 1
+            return path
+        finally:
+            self._busy.release()
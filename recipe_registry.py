@@ -0,0 +1,88 @@
+import threading
+
+## In-memory registry of the user's recipes, keyed by idDrink.
+## Each recipe has a status, 'saved' or 'created', and secondary indexes by status
+## and by category give the listings without scanning. Putting a recipe that is
+## already registered replaces it, so saving the same drink twice keeps one copy.
+
+STATUSES = ('saved', 'created')
+
+class RecipeRegistry:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_status = {status: {} for status in STATUSES}
+        self._by_category = {}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, drink_id):
+        return str(drink_id) in self._by_id
+
+    def load(self, saved=(), created=()):
+        ## Replace the registry contents, e.g. with the recipes from the database.
+        with self._lock:
+            self._by_id = {}
+            self._by_status = {status: {} for status in STATUSES}
+            self._by_category = {}
+            for record in saved:
+                self._put(record, 'saved')
+            for record in created:
+                self._put(record, 'created')
+
+    def get(self, drink_id):
+        ## Return the recipe with this id, or None.
+        entry = self._by_id.get(str(drink_id))
+        return entry[1] if entry else None
+
+    def status(self, drink_id):
+        ## Return 'saved', 'created' or None.
+        entry = self._by_id.get(str(drink_id))
+        return entry[0] if entry else None
+
+    def put(self, record, status):
+        ## Add a recipe or replace the one with the same id.
+        with self._lock:
+            self._put(record, status)
+
+    def remove(self, drink_id):
+        with self._lock:
+            self._remove(str(drink_id))
+
+    def by_status(self, status):
+        ## Return the recipes with this status in the order they were first added.
+        with self._lock:
+            return list(self._by_status[status].values())
+
+    def by_category(self, category):
+        with self._lock:
+            return list(self._by_category.get(category, {}).values())
+
+    def count(self, status=None):
+        if status is None:
+            return len(self._by_id)
+        return len(self._by_status[status])
+
+    def _put(self, record, status):
+        drink_id = str(record['idDrink'])
+        record['idDrink'] = drink_id
+        category = record.get('strCategory')
+        previous = self._by_id.get(drink_id)
+        if previous is not None and (previous[0], previous[2]) != (status, category):
+            self._remove(drink_id)
+        self._by_id[drink_id] = (status, record, category)
+        self._by_status[status][drink_id] = record
+        self._by_category.setdefault(category, {})[drink_id] = record
+
+    def _remove(self, drink_id):
+        entry = self._by_id.pop(drink_id, None)
+        if entry is None:
+            return
+        status, record, category = entry
+        self._by_status[status].pop(drink_id, None)
+        recipes = self._by_category.get(category)
+        if recipes is not None:
+            recipes.pop(drink_id, None)
+            if not recipes:
+                del self._by_category[category]
@@ -0,0 +1,304 @@
+import argparse
+import math
+import threading
+import time
+import zlib
+from ingredient_index import drink_ingredients
+
+## Ingredient-similarity recommender: the "similar drinks" of a recipe page.
+## Every drink is a sparse vector over the ingredients, weighted by how rare each
+## ingredient is (idf) and normalized, so the dot product of two drinks is their
+## cosine similarity. The top-k neighbours of every drink are computed once, from
+## the ingredient postings, and kept in two k-wide arrays, so a lookup is constant
+## time. Drinks added later (created recipes) are scored against the existing ones
+## and inserted into their neighbour lists without a rebuild; the arrays grow
+## geometrically, so an add doesn't copy them. A list that still holds a removed or
+## replaced drink is scored again, the same way, the next time it is looked up.
+## daily_pick() chooses the drink of the day, the same one all day.
+
+DEFAULT_K = 10
+BLOCK_ROWS = 512
+
+## Set by load_numpy() on first use, so importing main doesn't import NumPy
+np = None
+sparse = None
+_numpy_missing = False
+
+def load_numpy():
+    ## Import NumPy, and SciPy if it is installed. Returns False if NumPy is missing:
+    ## it is optional, and without it there are no similar drinks. SciPy makes the
+    ## rebuild faster; the NumPy path gives the same neighbours.
+    global np, sparse, _numpy_missing
+    if np is None and not _numpy_missing:
+        try:
+            import numpy
+        except ImportError:
+            _numpy_missing = True
+            return False
+        try:
+            from scipy import sparse as scipy_sparse
+        except ImportError:
+            scipy_sparse = None
+        np, sparse = numpy, scipy_sparse
+    return np is not None
+
+def daily_pick(ids, day):
+    ## The id with the highest hash of (day, id): the same all day in every process, and
+    ## it stays the same when drinks are added unless a new one happens to score higher.
+    best, best_score = None, -1
+    prefix = f'{day.isoformat()}:'.encode()
+    for drink_id in ids:
+        score = zlib.crc32(str(drink_id).encode(), zlib.crc32(prefix))
+        if score > best_score:
+            best, best_score = drink_id, score
+    return best
+
+class Recommender:
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self._lock = threading.Lock()
+        self._ids = []
+        self._rows = {}
+        self._ingredients = []
+        self._dead = set()
+        self._vocab = {}
+        self._idf = None
+        ## Ingredient postings (rows and weights per ingredient column) of the built drinks
+        self._post_ptr = None
+        self._post_rows = None
+        self._post_weights = None
+        ## Postings of the drinks added after the build: column -> [(row, weight)]
+        self._extra = {}
+        self._neighbours = None
+        self._scores = None
+        self.build_seconds = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getstate__(self):
+        ## Pickled into its snapshot (see snapshot.py) without its lock
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return load_numpy()
+
+    def build(self, drinks):
+        ## Replace the model with the given drink records and compute every neighbour list.
+        if not load_numpy():
+            return
+        started = time.perf_counter()
+        ids, ingredients, seen = [], [], set()
+        for drink in drinks:
+            drink_id = str(drink['idDrink'])
+            if drink_id in seen:
+                continue
+            seen.add(drink_id)
+            ids.append(drink_id)
+            ingredients.append(frozenset(drink_ingredients(drink)))
+        vocab = {}
+        columns = [[vocab.setdefault(name, len(vocab)) for name in sorted(names)] for names in ingredients]
+        n, m = len(ids), len(vocab)
+
+        lengths = np.fromiter((len(c) for c in columns), dtype=np.int64, count=n)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.fromiter((c for row in columns for c in row), dtype=np.int64, count=int(indptr[-1]))
+        entry_rows = np.repeat(np.arange(n, dtype=np.int64), lengths)
+        df = np.bincount(indices, minlength=m)
+        idf = np.log1p(n / np.maximum(df, 1))
+        data = idf[indices]
+        norms = np.sqrt(np.bincount(entry_rows, weights=data * data, minlength=n))
+        data = data / np.where(norms > 0, norms, 1)[entry_rows]
+
+        order = np.argsort(indices, kind='stable')
+        post_ptr = np.zeros(m + 1, dtype=np.int64)
+        np.cumsum(df, out=post_ptr[1:])
+        post_rows, post_weights = entry_rows[order], data[order]
+
+        neighbours = np.full((n, self.k), -1, dtype=np.int32)
+        scores = np.zeros((n, self.k), dtype=np.float32)
+        if sparse is not None:
+            self._top_k_scipy(indptr, indices, data, n, m, neighbours, scores)
+        else:
+            for row in range(n):
+                start, end = indptr[row], indptr[row + 1]
+                candidates, values = self._candidates(post_ptr, post_rows, post_weights, indices[start:end], data[start:end])
+                self._keep_top(row, candidates, values, neighbours, scores)
+
+        with self._lock:
+            self._ids = ids
+            self._rows = {drink_id: row for row, drink_id in enumerate(ids)}
+            self._ingredients = ingredients
+            self._dead = set()
+            self._vocab = vocab
+            self._idf = idf
+            self._post_ptr, self._post_rows, self._post_weights = post_ptr, post_rows, post_weights
+            self._extra = {}
+            self._neighbours, self._scores = neighbours, scores
+        self.build_seconds = round(time.perf_counter() - started, 3)
+
+    def _top_k_scipy(self, indptr, indices, data, n, m, neighbours, scores):
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=(n, m))
+        transposed = matrix.T.tocsr()
+        for start in range(0, n, BLOCK_ROWS):
+            block = (matrix[start:start + BLOCK_ROWS] @ transposed).tocsr()
+            for offset in range(block.shape[0]):
+                lo, hi = block.indptr[offset], block.indptr[offset + 1]
+                self._keep_top(start + offset, block.indices[lo:hi], block.data[lo:hi], neighbours, scores)
+
+    @staticmethod
+    def _candidates(post_ptr, post_rows, post_weights, columns, weights):
+        ## Rows sharing an ingredient with a vector, and their summed products (dot products).
+        if not len(columns):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        parts = [(post_rows[post_ptr[c]:post_ptr[c + 1]], post_weights[post_ptr[c]:post_ptr[c + 1]] * w)
+                 for c, w in zip(columns, weights)]
+        rows = np.concatenate([p[0] for p in parts])
+        values = np.concatenate([p[1] for p in parts])
+        unique, inverse = np.unique(rows, return_inverse=True)
+        return unique, np.bincount(inverse, weights=values)
+
+    def _keep_top(self, row, candidates, values, neighbours, scores):
+        ## Store the k best candidates of a row, best first (equal scores in row order).
+        keep = candidates != row
+        candidates, values = candidates[keep], values[keep]
+        if len(candidates) > self.k:
+            top = np.argpartition(-values, self.k - 1)[:self.k]
+            candidates, values = candidates[top], values[top]
+        order = np.lexsort((candidates, -values))
+        neighbours[row, :len(order)] = candidates[order]
+        scores[row, :len(order)] = values[order]
+
+    def add(self, drink):
+        ## Add or update one drink, e.g. a newly created recipe, and insert it into the
+        ## neighbour lists of the drinks it is similar to. The ingredient weights of the
+        ## last build are kept; new ingredients count as the rarest.
+        if self._neighbours is None or not load_numpy():
+            return
+        drink_id = str(drink['idDrink'])
+        names = frozenset(drink_ingredients(drink))
+        with self._lock:
+            old = self._rows.get(drink_id)
+            if old is not None:
+                if self._ingredients[old] == names:
+                    return
+                self._dead.add(old)
+            row = len(self._ids)
+            columns, weights = self._vector(names, len(self._rows) + 1)
+            scored = self._score(columns, weights)
+            if row == len(self._neighbours):
+                self._grow()
+            self._set_neighbours(row, scored)
+            for other, score in scored.items():
+                self._insert(other, row, score)
+
+            self._ids.append(drink_id)
+            self._ingredients.append(names)
+            self._rows[drink_id] = row
+            for c, w in zip(columns, weights):
+                self._extra.setdefault(c, []).append((row, float(w)))
+
+    def _vector(self, names, n):
+        ## Ingredient columns and normalized weights of a drink, with n drinks in the model.
+        columns = [self._vocab.setdefault(name, len(self._vocab)) for name in sorted(names)]
+        weights = np.array([self._idf[c] if c < len(self._idf) else math.log1p(n) for c in columns])
+        if len(weights):
+            weights /= np.sqrt((weights * weights).sum())
+        return columns, weights
+
+    def _score(self, columns, weights):
+        ## {row: similarity} of every live drink sharing an ingredient with a vector. Caller holds the lock.
+        built = len(self._post_ptr) - 1
+        candidates, values = self._candidates(self._post_ptr, self._post_rows, self._post_weights,
+                                              [c for c in columns if c < built],
+                                              [w for c, w in zip(columns, weights) if c < built])
+        scored = dict(zip(candidates.tolist(), values.tolist()))
+        for c, w in zip(columns, weights):
+            for other, weight in self._extra.get(c, ()):
+                scored[other] = scored.get(other, 0.0) + w * weight
+        for dead in self._dead:
+            scored.pop(dead, None)
+        return scored
+
+    def _set_neighbours(self, row, scored):
+        ## Replace a row's list with the k best of {row: similarity}. Caller holds the lock.
+        self._neighbours[row] = -1
+        self._scores[row] = 0
+        if scored:
+            self._keep_top(row, np.fromiter(scored, dtype=np.int64, count=len(scored)),
+                           np.fromiter(scored.values(), dtype=np.float64, count=len(scored)),
+                           self._neighbours, self._scores)
+
+    def _grow(self):
+        ## Make room for more rows than are used (len(self._ids)). Caller holds the lock.
+        used = len(self._neighbours)
+        capacity = used + used // 2 + 64
+        neighbours = np.full((capacity, self.k), -1, dtype=np.int32)
+        scores = np.zeros((capacity, self.k), dtype=np.float32)
+        neighbours[:used], scores[:used] = self._neighbours, self._scores
+        self._neighbours, self._scores = neighbours, scores
+
+    def remove(self, drink_id):
+        ## Drop a drink, e.g. a deleted recipe; it no longer shows up as anyone's neighbour.
+        with self._lock:
+            row = self._rows.pop(str(drink_id), None)
+            if row is not None:
+                self._dead.add(row)
+
+    def _insert(self, row, neighbour, score):
+        ## Put a neighbour into a row's sorted list if it beats the last one. Caller holds the lock.
+        scores, neighbours = self._scores[row], self._neighbours[row]
+        if neighbours[-1] >= 0 and score <= scores[-1]:
+            return
+        position = int(np.searchsorted(-scores[neighbours >= 0], -score, side='right'))
+        scores[position + 1:] = scores[position:-1].copy()
+        neighbours[position + 1:] = neighbours[position:-1].copy()
+        scores[position], neighbours[position] = score, neighbour
+
+    def similar(self, drink_id, limit=None):
+        ## Return [(id, similarity)] of the drinks most like this one, best first.
+        with self._lock:
+            row = self._rows.get(str(drink_id))
+            if row is None or self._neighbours is None:
+                return []
+            if self._dead and not self._dead.isdisjoint(self._neighbours[row].tolist()):
+                ## A neighbour was removed or replaced: score the row again to fill its list
+                self._set_neighbours(row, self._score(*self._vector(self._ingredients[row], len(self._rows))))
+            pairs = [(self._ids[other], float(score)) for other, score in zip(self._neighbours[row], self._scores[row])
+                     if other >= 0 and other not in self._dead and score > 0]
+        return pairs[:limit] if limit else pairs
+
+def measure_rebuild(counts, k=DEFAULT_K):
+    ## Time a full rebuild on synthetic catalogs of the given sizes, and one incremental add.
+    from catalog import synthetic_records
+    load_numpy()
+    results = []
+    for count in counts:
+        records = synthetic_records(count)
+        recommender = Recommender(k)
+        recommender.build(records)
+        started = time.perf_counter()
+        recommender.add(dict(records[0], idDrink='created-1'))
+        results.append({'drinks': count, 'rebuild_seconds': recommender.build_seconds,
+                        'add_ms': round((time.perf_counter() - started) * 1000, 2),
+                        'backend': 'scipy' if sparse is not None else 'numpy'})
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the rebuild time of the similar-drinks recommender.')
+    parser.add_argument('--drinks', type=int, nargs='+', default=[10000, 100000], help='synthetic catalog sizes')
+    parser.add_argument('-k', type=int, default=DEFAULT_K, help='neighbours kept per drink')
+    args = parser.parse_args()
+    if not load_numpy():
+        raise SystemExit('NumPy is not installed.')
+    for result in measure_rebuild(args.drinks, args.k):
+        print(f"{result['drinks']} drinks: rebuild {result['rebuild_seconds']} s ({result['backend']}), "
+              f"incremental add {result['add_ms']} ms")
@@ -0,0 +1,193 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import ThreadedWSGIServer
+import applog
+import bootstrap
+from main import create_app
+from sources import UPSTREAM_SOURCE
+
+## Production entry point: several worker processes answering on one port.
+## The master builds the app and runs the required warmup steps (recipes, catalog and
+## search indexes) before it forks, so every worker starts ready and shares those
+## objects with the master copy-on-write instead of loading a copy of its own.
+## gc.freeze() keeps the garbage collector from writing to (and so copying) them.
+## Each worker then runs the warmup steps that are left itself. The drink detail cache and
+## the API mirror are sqlite files in WAL mode that all workers read and write, and
+## saved recipes are kept in sync through the database (see sync_recipes in main.py),
+## so adding workers doesn't multiply cold caches or split the user's data.
+##
+## gunicorn is used when it is installed (`pip install gunicorn`); otherwise a small
+## pre-fork server on werkzeug does the same job. Without os.fork (Windows) the app
+## runs in a single process.
+##
+##   python serve.py --workers 4 --threads 8 --port 8000
+##
+## WEB_CONCURRENCY sets the default number of workers (one per CPU otherwise).
+
+log = applog.get_logger('serve')
+
+def default_workers():
+    if os.environ.get('WEB_CONCURRENCY'):
+        return int(os.environ['WEB_CONCURRENCY'])
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def load_app():
+    ## Build the app and run the required warmup steps in this process, before any fork.
+    app = create_app({'WARMUP_ON_START': False})
+    ## The bootstrap of an empty catalog runs here, once, instead of once per worker. It
+    ## runs to the end before the preload and the fork: a fork while its thread or the API
+    ## pool holds a lock would leave that lock held forever in the workers. The catalog
+    ## step below then imports the data/default.csv it wrote.
+    optional = ['category_index', 'recommender']
+    if app.config["STORE"].count_drinks(UPSTREAM_SOURCE) > 0 or bootstrap.run_bootstrap() is not None:
+        ## Nothing left for the bootstrap step to start
+        optional.append('bootstrap')
+    ## The category index and the recommender too, so the workers don't each fan out to
+    ## the API for the one or build a copy of the other. If the bootstrap is incomplete,
+    ## the workers resume it from its checkpoints in the background.
+    if not app.config["WARMUP"].preload(*optional):
+        raise SystemExit('The warmup failed; see the log for the step that failed.')
+    ## Everything allocated so far lives as long as the app; leave it out of future collections
+    gc.freeze()
+    return app
+
+def after_fork(app):
+    ## In a new worker: run the warmup steps that are left, if any.
+    app.config["WARMUP"].start()
+    ## log_request already writes a line per request
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+def serve_gunicorn(app, args):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            settings = {
+                'bind': f'{args.host}:{args.port}',
+                'workers': args.workers,
+                'threads': args.threads,
+                'worker_class': 'gthread' if args.threads > 1 else 'sync',
+                'preload_app': True,
+                'timeout': args.timeout,
+                'post_fork': lambda server, worker: after_fork(app),
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+class PooledWSGIServer(ThreadedWSGIServer):
+    ## werkzeug's threaded server starts a thread per connection; this one hands the
+    ## connections to a fixed pool of `threads` threads.
+    def __init__(self, host, port, app, threads, fd=None):
+        super().__init__(host, port, app, fd=fd)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+def run_worker(app, sock, threads):
+    ## Body of a forked worker; never returns.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        after_fork(app)
+        host, port = sock.getsockname()[:2]
+        server = PooledWSGIServer(host, port, app, threads, fd=sock.fileno())
+        ## shutdown() waits for serve_forever() to return, so it can't run on this thread
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        server.serve_forever()
+    except Exception:
+        log.exception('Worker failed', pid=os.getpid())
+    finally:
+        applog.stop_logging()
+        os._exit(0)
+
+def serve_prefork(app, sock, workers, threads):
+    ## Fork `workers` processes that accept connections on the listening socket `sock`,
+    ## and replace any that die until SIGTERM or SIGINT.
+    children = set()
+    host, port = sock.getsockname()[:2]
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(app, sock, threads)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    log.info('Serving', url=f'http://{host}:{port}', workers=workers, threads=threads)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            log.warning('Worker exited, starting a new one', pid=pid, status=status)
+            spawn()
+    sock.close()
+
+def serve_single(app, host, port, threads):
+    after_fork(app)
+    server = PooledWSGIServer(host, port, app, threads)
+    log.info('Serving', url=f'http://{host}:{server.server_port}', workers=1, threads=threads)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run CafeCopyCat with several worker processes.')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=default_workers(), help='worker processes (default: WEB_CONCURRENCY or one per CPU)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('THREADS', 8)), help='request threads per worker')
+    parser.add_argument('--timeout', type=int, default=60, help='seconds before gunicorn restarts a stuck worker')
+    parser.add_argument('--backlog', type=int, default=2048, help='listen backlog of the shared socket (pre-fork server)')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'prefork', 'single'], default='auto')
+    args = parser.parse_args()
+
+    server = args.server
+    if server == 'auto':
+        try:
+            import gunicorn
+            server = 'gunicorn'
+        except ImportError:
+            server = 'prefork' if hasattr(os, 'fork') else 'single'
+    if server == 'single':
+        args.workers = 1
+
+    app = load_app()
+    log.info('Catalog preloaded', drinks=len(app.config["CATALOG"]), seconds=app.config["WARMUP"].ready_after, server=server)
+    if server == 'gunicorn':
+        serve_gunicorn(app, args)
+    elif server == 'prefork':
+        serve_prefork(app, socket.create_server((args.host, args.port), backlog=args.backlog), args.workers, args.threads)
+    else:
+        serve_single(app, args.host, args.port, args.threads)
@@ -0,0 +1,73 @@
+import threading
+import requests
+
+## Request coalescing ("single flight") for upstream calls.
+## When several threads ask for the same key at once, only the first one runs the
+## call; the others wait for it and share its result (or its exception). Waiters
+## give up after a timeout so a stuck upstream call can't pile up threads forever.
+
+class SingleFlightTimeout(requests.exceptions.Timeout):
+    ## Raised to a waiter whose shared call didn't finish within the wait timeout.
+    pass
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self, timeout=15.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key, func, *args):
+        ## Run func(*args) once per key at a time and return its result to every caller.
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.executions += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise SingleFlightTimeout(f"Timed out after {self.timeout}s waiting for {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'executions': self.executions, 'coalesced': self.coalesced,
+                    'timeouts': self.timeouts, 'in_flight': len(self._calls)}
@@ -0,0 +1,47 @@
+import os
+import pickle
+import tempfile
+import applog
+
+## Binary snapshot of the in-memory catalog and search indexes.
+## Building them from the database means decoding every drink's JSON and indexing it
+## again, which takes seconds for a large catalog. The snapshot is a pickle of the
+## finished objects tagged with the database's drinks version, so a restart with an
+## unchanged catalog only has to unpickle it. A stale or unreadable snapshot is
+## ignored and rebuilt.
+
+FORMAT = 1
+
+log = applog.get_logger('snapshot')
+
+def load_snapshot(path, version):
+    ## Return the dict of saved objects, or None if the file is missing, stale or unreadable.
+    if not path or version is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning('Ignoring an unreadable snapshot', path=path, error=f'{type(e).__name__}: {e}')
+        return None
+    if not isinstance(data, dict) or data.get('format') != FORMAT or data.get('version') != version:
+        return None
+    return data['objects']
+
+def save_snapshot(path, version, **objects):
+    ## Write the objects to path atomically, tagged with the drinks version.
+    if not path:
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'format': FORMAT, 'version': version, 'objects': objects}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from storage import read_csv_records
+
+## Local CSV catalogs merged with the drinks from TheCocktailDB.
+## Each source is a CSV file in data/ under a name. Its rows are brought into the
+## upstream record shape (a comma separated strIngredients column becomes
+## strIngredient1..n) and their ids are put in a namespace of their own,
+## "coffee_and_tea-3", so they can't collide with TheCocktailDB's ids or each other.
+## The 'default' source is the exception: default.csv holds TheCocktailDB drinks
+## (bootstrap.py writes it), so it keeps their ids and merges with the upstream rows.
+## Drinks are deduplicated by id and by name within a category; the first source in
+## SOURCE_PRIORITY wins. A source is written to the database again when the mtime
+## of its file changes, and the app then reloads its catalog without a restart.
+
+UPSTREAM_SOURCE = 'default'
+LOCAL_SOURCES = {
+    'default': os.path.join('data', 'default.csv'),
+    'coffee_and_tea': os.path.join('data', 'coffee_and_tea.csv'),
+}
+## Order in which duplicates are resolved; sources not listed come last
+SOURCE_PRIORITY = (UPSTREAM_SOURCE, 'coffee_and_tea')
+NAMESPACE_SEPARATOR = '-'
+MAX_INGREDIENTS = 15
+
+def namespaced_id(source, drink_id):
+    if source == UPSTREAM_SOURCE:
+        return str(drink_id)
+    return f'{source}{NAMESPACE_SEPARATOR}{drink_id}'
+
+def source_of(drink_id):
+    ## The source a drink id belongs to. TheCocktailDB ids and created recipes are numeric.
+    drink_id = str(drink_id)
+    if NAMESPACE_SEPARATOR in drink_id:
+        source = drink_id.rsplit(NAMESPACE_SEPARATOR, 1)[0]
+        if source in LOCAL_SOURCES:
+            return source
+    return UPSTREAM_SOURCE
+
+def is_local(drink_id):
+    ## Whether a drink is served from a local source only, never from the API.
+    return source_of(drink_id) != UPSTREAM_SOURCE
+
+def normalize_record(record, source):
+    ## Bring a CSV row into the upstream record shape, with its id in the source's namespace.
+    record = {key: value for key, value in record.items() if value is not None}
+    if record.get('idDrink') is None:
+        return None
+    record['idDrink'] = namespaced_id(source, record['idDrink'])
+    ingredients = record.pop('strIngredients', None)
+    if isinstance(ingredients, str) and not record.get('strIngredient1'):
+        names = [name.strip() for name in ingredients.split(',') if name.strip()]
+        for i, name in enumerate(names[:MAX_INGREDIENTS], 1):
+            record[f'strIngredient{i}'] = name
+    return record
+
+def read_source(source, path=None):
+    ## Return the normalized records of a local source. A missing file gives [].
+    records = (normalize_record(row, source) for row in read_csv_records(path or LOCAL_SOURCES[source]))
+    return [record for record in records if record is not None]
+
+def dedupe_key(record):
+    name = ' '.join(str(record.get('strDrink') or '').lower().split())
+    return (name, record.get('strCategory')) if name else None
+
+def merge_records(records_by_source):
+    ## Merge {source: records} into one list without duplicates, in SOURCE_PRIORITY order.
+    ## A drink is a duplicate if its id, or its name in the same category, was seen before.
+    order = sorted(records_by_source, key=lambda s: SOURCE_PRIORITY.index(s) if s in SOURCE_PRIORITY else len(SOURCE_PRIORITY))
+    seen_ids = set()
+    seen_names = set()
+    merged = []
+    for source in order:
+        for record in records_by_source[source]:
+            drink_id = str(record['idDrink'])
+            key = dedupe_key(record)
+            if drink_id in seen_ids or (key is not None and key in seen_names):
+                continue
+            seen_ids.add(drink_id)
+            if key is not None:
+                seen_names.add(key)
+            merged.append(record)
+    return merged
+
+def file_mtime(path):
+    try:
+        return str(os.stat(path).st_mtime_ns)
+    except OSError:
+        return None
+
+def changed_sources(store, sources=None):
+    ## Names of the sources whose file changed since it was last written to the database.
+    sources = sources or LOCAL_SOURCES
+    return [source for source, path in sources.items() if file_mtime(path) != store.get_meta(f'source_mtime:{source}')]
+
+def sync_sources(store, sources=None, force=False):
+    ## Write the changed sources to the database. Returns {source: number of drinks}, without
+    ## the sources another worker imported first.
+    sources = sources or LOCAL_SOURCES
+    counts = {}
+    for source in (list(sources) if force else changed_sources(store, sources)):
+        mtime = file_mtime(sources[source])
+        records = read_source(source, sources[source])
+        ## default.csv is the bootstrap's download; a shorter copy of it never drops stored drinks
+        if store.import_source(source, records, mtime, replace=source != UPSTREAM_SOURCE, force=force):
+            counts[source] = len(records)
+    return counts
+
+class SourceWatcher:
+    ## Rate limit for the checks of the source files: due() is True at most once per interval.
+    def __init__(self, interval=5):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_check = time.monotonic() + interval
+
+    def due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_check:
+                return False
+            self._next_check = now + self.interval
+            return True
@@ -0,0 +1,428 @@
+import argparse
+import csv
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+## sqlite storage for the drink catalog, saved recipes and created recipes.
+## The database runs in WAL mode so several worker processes can read while one
+## writes, every thread gets its own connection, and ratings and notes are saved
+## with single-row upserts instead of rewriting a CSV file.
+## Every change to the recipes takes the next recipes version and stamps it on the rows
+## it wrote (deleted ones are kept in deleted_recipes), so another worker only reads
+## what changed since the version it last saw (see recipe_changes).
+## rating_stats keeps the number, sum and mean of the ratings of every drink. Each
+## rating adds to it, and changing the user's own rating of a recipe moves it, so the
+## top rated drinks are an index scan of k rows instead of an aggregate over all ratings.
+## Drinks from the CSV catalogs in data/ are written by sources.py whenever a file
+## changes; `python storage.py import` loads them and the saved recipes up front.
+
+DB_PATH = os.path.join('data', 'cafecopycat.sqlite')
+SAVED_RECIPES_CSV = os.path.join('data', 'saved_recipes.csv')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS drinks (
+    idDrink TEXT PRIMARY KEY,
+    strDrink TEXT,
+    strCategory TEXT,
+    strAlcoholic TEXT,
+    strDrinkThumb TEXT,
+    source TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS drinks_category ON drinks (strCategory);
+CREATE INDEX IF NOT EXISTS drinks_source ON drinks (source);
+CREATE TABLE IF NOT EXISTS drink_ingredients (
+    idDrink TEXT NOT NULL,
+    ingredient TEXT NOT NULL,
+    PRIMARY KEY (idDrink, ingredient)
+);
+CREATE INDEX IF NOT EXISTS drink_ingredients_ingredient ON drink_ingredients (ingredient);
+CREATE TABLE IF NOT EXISTS recipes (
+    idDrink TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    strCategory TEXT,
+    notes TEXT,
+    rating INTEGER,
+    saved_date TEXT,
+    updated_at REAL,
+    version INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recipes_kind ON recipes (kind);
+CREATE INDEX IF NOT EXISTS recipes_category ON recipes (strCategory);
+CREATE TABLE IF NOT EXISTS deleted_recipes (
+    idDrink TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rating_stats (
+    idDrink TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    mean REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rating_stats_mean ON rating_stats (mean DESC, count DESC, idDrink);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+def clean_record(record):
+    ## Drop NaN values left over from pandas and use string ids everywhere.
+    cleaned = {}
+    for key, value in record.items():
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        cleaned[key] = value
+    if cleaned.get('idDrink') is not None:
+        cleaned['idDrink'] = str(cleaned['idDrink'])
+    return cleaned
+
+def rating_value(value):
+    ## A stored rating as an int, or None if there is none (or it isn't a number).
+    try:
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+def record_ingredients(record):
+    ## Return the normalized ingredients of a record, from strIngredient1..15 or
+    ## from a comma separated strIngredients column.
+    names = [record.get(f'strIngredient{i}') for i in range(1, 16)]
+    if isinstance(record.get('strIngredients'), str):
+        names.extend(record['strIngredients'].split(','))
+    return {' '.join(name.lower().split()) for name in names if isinstance(name, str) and name.strip()}
+
+class Store:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self.conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        if 'version' not in [column[1] for column in conn.execute('PRAGMA table_info(recipes)')]:
+            conn.execute('ALTER TABLE recipes ADD COLUMN version INTEGER')
+        conn.execute('CREATE INDEX IF NOT EXISTS recipes_version ON recipes (version)')
+        conn.commit()
+        if self.get_meta('rating_stats') is None:
+            ## Databases from before rating_stats: count the ratings of the stored recipes once
+            with conn:
+                rows = conn.execute('SELECT idDrink, rating FROM recipes WHERE rating IS NOT NULL').fetchall()
+                self._add_ratings(conn, [(drink_id, 1, rating_value(rating)) for drink_id, rating in rows
+                                         if rating_value(rating) is not None])
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rating_stats', '1')")
+
+    def conn(self):
+        ## One connection per thread, reopened after a fork.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    ## Catalog
+
+    def upsert_drinks(self, records, source):
+        ## Insert or update catalog drinks in one transaction.
+        conn = self.conn()
+        with conn:
+            self._upsert_drinks(conn, records, source)
+
+    def replace_source(self, source, records):
+        ## Make the drinks of a source exactly these records, in one transaction.
+        conn = self.conn()
+        with conn:
+            self._replace_source(conn, source, records)
+
+    def import_source(self, source, records, mtime, replace=True, force=False):
+        ## Write the drinks of a source file (replacing them, or only upserting) together with
+        ## the file's mtime, in one transaction. Setting the mtime is the first write and takes
+        ## the write lock, so when several workers see the same change of the file only the
+        ## first one imports it. Returns False if another process already had, unless force.
+        conn = self.conn()
+        with conn:
+            cursor = conn.execute(
+                '''INSERT INTO meta (key, value) VALUES (?, ?)
+                   ON CONFLICT(key) DO UPDATE SET value = excluded.value WHERE meta.value IS NOT excluded.value''',
+                (f'source_mtime:{source}', mtime))
+            if not cursor.rowcount and not force:
+                return False
+            if replace:
+                self._replace_source(conn, source, records)
+            else:
+                self._upsert_drinks(conn, records, source)
+        return True
+
+    def _replace_source(self, conn, source, records):
+        self._upsert_drinks(conn, records, source)
+        keep = {str(record['idDrink']) for record in records}
+        stale = [(drink_id,) for (drink_id,) in conn.execute('SELECT idDrink FROM drinks WHERE source = ?', (source,))
+                 if drink_id not in keep]
+        conn.executemany('DELETE FROM drink_ingredients WHERE idDrink = ?', stale)
+        conn.executemany('DELETE FROM drinks WHERE idDrink = ?', stale)
+
+    def _upsert_drinks(self, conn, records, source):
+        for record in records:
+            record = clean_record(record)
+            conn.execute(
+                '''INSERT INTO drinks (idDrink, strDrink, strCategory, strAlcoholic, strDrinkThumb, source, data)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(idDrink) DO UPDATE SET strDrink = excluded.strDrink, strCategory = excluded.strCategory,
+                       strAlcoholic = excluded.strAlcoholic, strDrinkThumb = excluded.strDrinkThumb,
+                       source = excluded.source, data = excluded.data''',
+                (record['idDrink'], record.get('strDrink'), record.get('strCategory'), record.get('strAlcoholic'),
+                 record.get('strDrinkThumb'), source, json.dumps(record)))
+            conn.execute('DELETE FROM drink_ingredients WHERE idDrink = ?', (record['idDrink'],))
+            conn.executemany('INSERT INTO drink_ingredients (idDrink, ingredient) VALUES (?, ?)',
+                             [(record['idDrink'], ingredient) for ingredient in record_ingredients(record)])
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('drinks_version', ?)", (str(time.time_ns()),))
+
+    def drinks_version(self):
+        ## Token that changes whenever the catalog drinks change; keys the catalog snapshot.
+        version = self.get_meta('drinks_version')
+        if version is None:
+            version = str(time.time_ns())
+            self.set_meta('drinks_version', version)
+        return version
+
+    def count_drinks(self, source=None):
+        if source is None:
+            return self.conn().execute('SELECT COUNT(*) FROM drinks').fetchone()[0]
+        return self.conn().execute('SELECT COUNT(*) FROM drinks WHERE source = ?', (source,)).fetchone()[0]
+
+    def catalog_records(self, source=None):
+        ## Return the full catalog records, optionally only those of one source.
+        if source is None:
+            rows = self.conn().execute('SELECT data FROM drinks ORDER BY rowid')
+        else:
+            rows = self.conn().execute('SELECT data FROM drinks WHERE source = ? ORDER BY rowid', (source,))
+        return [json.loads(data) for (data,) in rows]
+
+    def catalog_records_by_source(self):
+        ## Return {source: full catalog records}, each list in insertion order.
+        records = {}
+        for source, data in self.conn().execute('SELECT source, data FROM drinks ORDER BY rowid'):
+            records.setdefault(source, []).append(json.loads(data))
+        return records
+
+    def get_drink(self, drink_id):
+        row = self.conn().execute('SELECT data FROM drinks WHERE idDrink = ?', (str(drink_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def drinks_in_category(self, category):
+        rows = self.conn().execute('SELECT data FROM drinks WHERE strCategory = ? ORDER BY strDrink', (category,))
+        return [json.loads(data) for (data,) in rows]
+
+    def drinks_with_ingredient(self, ingredient):
+        rows = self.conn().execute(
+            '''SELECT d.data FROM drink_ingredients i JOIN drinks d ON d.idDrink = i.idDrink
+               WHERE i.ingredient = ? ORDER BY d.strDrink''', (' '.join(ingredient.lower().split()),))
+        return [json.loads(data) for (data,) in rows]
+
+    ## Saved and created recipes
+
+    def save_recipe(self, record, kind):
+        ## Insert or update a saved ('saved') or created ('created') recipe.
+        self.save_recipes([(record, kind)])
+
+    def save_recipes(self, recipes):
+        ## Insert or update (record, kind) pairs in one transaction, e.g. a batch import.
+        conn = self.conn()
+        with conn:
+            version = self._bump_recipes_version(conn)
+            for record, kind in recipes:
+                record = clean_record(record)
+                old = self._own_rating(conn, record['idDrink'])
+                conn.execute(
+                    '''INSERT INTO recipes (idDrink, kind, strCategory, notes, rating, saved_date, updated_at, version, data)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(idDrink) DO UPDATE SET kind = excluded.kind, strCategory = excluded.strCategory,
+                           notes = excluded.notes, rating = excluded.rating, saved_date = excluded.saved_date,
+                           updated_at = excluded.updated_at, version = excluded.version, data = excluded.data''',
+                    (record['idDrink'], kind, record.get('strCategory'), record.get('notes'), record.get('rating'),
+                     record.get('saved_date'), time.time(), version, json.dumps(record)))
+                conn.execute('DELETE FROM deleted_recipes WHERE idDrink = ?', (record['idDrink'],))
+                self._move_rating(conn, record['idDrink'], old, self._own_rating(conn, record['idDrink']))
+
+    def set_rating(self, drink_id, rating):
+        ## Update the rating of a stored recipe. Returns False if the recipe isn't stored.
+        conn = self.conn()
+        with conn:
+            version = self._bump_recipes_version(conn)
+            old = self._own_rating(conn, drink_id)
+            cursor = conn.execute('UPDATE recipes SET rating = ?, updated_at = ?, version = ? WHERE idDrink = ?',
+                                  (rating, time.time(), version, str(drink_id)))
+            if cursor.rowcount:
+                self._move_rating(conn, drink_id, old, rating)
+        return cursor.rowcount > 0
+
+    def set_notes(self, drink_id, notes):
+        ## Update the notes of a stored recipe. Returns False if the recipe isn't stored.
+        conn = self.conn()
+        with conn:
+            version = self._bump_recipes_version(conn)
+            cursor = conn.execute('UPDATE recipes SET notes = ?, updated_at = ?, version = ? WHERE idDrink = ?',
+                                  (notes, time.time(), version, str(drink_id)))
+        return cursor.rowcount > 0
+
+    def delete_recipe(self, drink_id):
+        conn = self.conn()
+        with conn:
+            version = self._bump_recipes_version(conn)
+            self._move_rating(conn, drink_id, self._own_rating(conn, drink_id), None)
+            cursor = conn.execute('DELETE FROM recipes WHERE idDrink = ?', (str(drink_id),))
+            if cursor.rowcount:
+                conn.execute('INSERT OR REPLACE INTO deleted_recipes (idDrink, version) VALUES (?, ?)', (str(drink_id), version))
+
+    def recipes_version(self):
+        ## Token that changes whenever a recipe is saved, rated or deleted, by any process.
+        return self.get_meta('recipes_version')
+
+    def _bump_recipes_version(self, conn):
+        ## Take the next recipes version. As the first write of the transaction it also takes
+        ## the write lock, so versions are committed in order.
+        conn.execute("""INSERT INTO meta (key, value) VALUES ('recipes_version', '1')
+                        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1""")
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'recipes_version'").fetchone()[0])
+
+    def recipe_changes(self, since):
+        ## Return (changed, deleted) since a recipes version: [(kind, record)] of the recipes
+        ## saved, rated or noted after it, and the ids of the ones deleted after it.
+        since = int(since or 0)
+        rows = self.conn().execute('SELECT kind, data, notes, rating FROM recipes WHERE version > ? ORDER BY rowid', (since,))
+        changed = []
+        for kind, data, notes, rating in rows:
+            record = json.loads(data)
+            record['notes'] = notes
+            record['rating'] = rating
+            changed.append((kind, record))
+        deleted = [drink_id for (drink_id,) in self.conn().execute('SELECT idDrink FROM deleted_recipes WHERE version > ?', (since,))]
+        return changed, deleted
+
+    def recipes(self, kind):
+        ## Return the saved or created recipes, oldest first, with their current notes and rating.
+        rows = self.conn().execute('SELECT data, notes, rating FROM recipes WHERE kind = ? ORDER BY rowid', (kind,))
+        recipes = []
+        for data, notes, rating in rows:
+            record = json.loads(data)
+            record['notes'] = notes
+            record['rating'] = rating
+            recipes.append(record)
+        return recipes
+
+    def iter_recipes(self, kind=None):
+        ## Yield the stored recipes one at a time, with their kind, notes and rating, e.g. for an export.
+        if kind is None:
+            rows = self.conn().execute('SELECT kind, data, notes, rating FROM recipes ORDER BY rowid')
+        else:
+            rows = self.conn().execute('SELECT kind, data, notes, rating FROM recipes WHERE kind = ? ORDER BY rowid', (kind,))
+        for kind, data, notes, rating in rows:
+            record = json.loads(data)
+            record.update(kind=kind, notes=notes, rating=rating)
+            yield record
+
+    ## Ratings
+
+    def add_ratings(self, ratings):
+        ## Add (drink id, rating) pairs, e.g. ratings synced from another system, to the
+        ## aggregates in one transaction. Returns the number of drinks rated.
+        deltas = {}
+        for drink_id, rating in ratings:
+            delta = deltas.setdefault(str(drink_id), [0, 0])
+            delta[0] += 1
+            delta[1] += rating
+        conn = self.conn()
+        with conn:
+            self._add_ratings(conn, [(drink_id, count, total) for drink_id, (count, total) in deltas.items()])
+        return len(deltas)
+
+    def rating_stats(self, drink_id):
+        ## Return {'count': n, 'mean': m} of a drink; mean is None if it has no ratings.
+        row = self.conn().execute('SELECT count, mean FROM rating_stats WHERE idDrink = ?', (str(drink_id),)).fetchone()
+        return {'count': row[0], 'mean': row[1]} if row else {'count': 0, 'mean': None}
+
+    def top_rated(self, limit=10, min_count=1):
+        ## Return [(drink id, count, mean)] of the best rated drinks, from the rating_stats_mean index.
+        return self.conn().execute(
+            'SELECT idDrink, count, mean FROM rating_stats WHERE count >= ? ORDER BY mean DESC, count DESC, idDrink LIMIT ?',
+            (min_count, limit)).fetchall()
+
+    def _own_rating(self, conn, drink_id):
+        row = conn.execute('SELECT rating FROM recipes WHERE idDrink = ?', (str(drink_id),)).fetchone()
+        return rating_value(row[0]) if row else None
+
+    def _move_rating(self, conn, drink_id, old, new):
+        ## Replace the user's own rating of a drink in the aggregates; either may be None.
+        new = rating_value(new)
+        count = (new is not None) - (old is not None)
+        total = (new or 0) - (old or 0)
+        if count or total:
+            self._add_ratings(conn, [(str(drink_id), count, total)])
+
+    def _add_ratings(self, conn, deltas):
+        ## Add (drink id, count, total) to the aggregates; a drink left without ratings is dropped.
+        conn.executemany(
+            '''INSERT INTO rating_stats (idDrink, count, total, mean)
+               VALUES (?1, ?2, ?3, CASE WHEN ?2 > 0 THEN CAST(?3 AS REAL) / ?2 ELSE 0 END)
+               ON CONFLICT(idDrink) DO UPDATE SET count = count + excluded.count, total = total + excluded.total,
+                   mean = CASE WHEN count + excluded.count > 0
+                               THEN CAST(total + excluded.total AS REAL) / (count + excluded.count) ELSE 0 END''',
+            deltas)
+        if any(count < 0 for _, count, _ in deltas):
+            conn.execute('DELETE FROM rating_stats WHERE count <= 0')
+
+    ## Import
+
+    def get_meta(self, key):
+        row = self.conn().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        conn = self.conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def import_csv_files(self, saved_recipes_csv=SAVED_RECIPES_CSV, force=False):
+        ## One-time import of the saved recipes CSV. Returns the number of rows imported per file.
+        if self.get_meta('csv_imported') and not force:
+            return {}
+        counts = {}
+        saved = read_csv_records(saved_recipes_csv)
+        for record in saved:
+            self.save_recipe(record, 'created' if record.get('strCategory') == 'Created Recipes' else 'saved')
+        counts[saved_recipes_csv] = len(saved)
+        self.set_meta('csv_imported', str(time.time()))
+        return counts
+
+def read_csv_records(path):
+    ## Read a CSV file into dicts with empty cells as None. Missing or empty files give [].
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            return [clean_record({key: value if value != '' else None for key, value in row.items()})
+                    for row in csv.DictReader(f)]
+    except FileNotFoundError:
+        return []
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the CafeCopyCat sqlite database.')
+    parser.add_argument('command', choices=['import'], help='import: load the CSV files from data/ into the database')
+    parser.add_argument('--db', default=DB_PATH, help='path of the sqlite database')
+    parser.add_argument('--force', action='store_true', help='import again even if the CSV files were imported before')
+    args = parser.parse_args()
+    from sources import LOCAL_SOURCES, sync_sources
+    store = Store(args.db)
+    counts = {LOCAL_SOURCES[source]: count for source, count in sync_sources(store, force=args.force).items()}
+    counts.update(store.import_csv_files(force=args.force))
+    if not counts:
+        print('CSV files were already imported. Use --force to import them again.')
+    for path, count in counts.items():
+        print(f'Imported {count} rows from {path}')
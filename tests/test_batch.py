@@ -0,0 +1,57 @@
+import io
+import pytest
+from batch import BatchError, check_rating, parse_rating, parse_recipe, read_items
+
+def items(text, mimetype='application/x-ndjson'):
+    return list(read_items(io.BytesIO(text.encode()), mimetype))
+
+@pytest.mark.parametrize('value, expected', [(4, 4), ('5', 5), (1.0, 1)])
+def test_check_rating(value, expected):
+    assert check_rating(value) == expected
+
+@pytest.mark.parametrize('value', [True, 4.7, 0, 6, '4.5', None, float('nan')])
+def test_check_rating_rejects(value):
+    with pytest.raises(ValueError):
+        check_rating(value)
+
+def test_ndjson_lines_keep_their_numbers():
+    assert items('{"a": 1}\n\n{"a": 2}\n') == [(1, {'a': 1}), (3, {'a': 2})]
+
+def test_invalid_json_reports_its_line():
+    with pytest.raises(BatchError) as e:
+        items('{"a": 1}\n{oops\n')
+    assert e.value.line == 2
+
+def test_json_array():
+    assert items('[{"a": 1}, {"a": 2}]', 'application/json') == [(1, {'a': 1}), (2, {'a': 2})]
+    with pytest.raises(BatchError):
+        items('{"a": 1}', 'application/json')
+
+def test_parse_rating():
+    assert parse_rating(1, {'idDrink': 11007, 'rating': 5}) == ('11007', 5)
+    with pytest.raises(BatchError) as e:
+        parse_rating(7, {'idDrink': '11007', 'rating': 9})
+    assert (e.value.line, e.value.message) == (7, 'rating must be between 1 and 5')
+    with pytest.raises(BatchError):
+        parse_rating(1, {'rating': 3})
+
+def test_parse_recipe():
+    record, kind = parse_recipe(1, {'strDrink': 'Mine', 'kind': 'created', 'rating': '4'}, lambda: '123456')
+    assert kind == 'created'
+    assert record['idDrink'] == '123456'
+    assert record['strCategory'] == 'Created Recipes'
+    assert record['rating'] == 4
+    assert 'kind' not in record
+    record, kind = parse_recipe(1, {'idDrink': '11007', 'strDrink': 'Margarita'}, None)
+    assert (kind, record['rating']) == ('saved', None)
+
+@pytest.mark.parametrize('item, message', [
+    ({'idDrink': '1'}, 'expected a recipe object with strDrink'),
+    ({'strDrink': 'Margarita'}, 'a saved recipe needs its idDrink'),
+    ({'strDrink': 'Margarita', 'idDrink': '1', 'kind': 'other'}, 'kind must be one of saved, created'),
+    ({'strDrink': 'Margarita', 'idDrink': '1', 'rating': True}, 'rating must be a number'),
+])
+def test_parse_recipe_rejects(item, message):
+    with pytest.raises(BatchError) as e:
+        parse_recipe(3, item, lambda: '1')
+    assert (e.value.line, e.value.message) == (3, message)
@@ -0,0 +1,44 @@
+from ingredient_index import IngredientIndex, parse_ingredient_query
+
+def make_index():
+    index = IngredientIndex()
+    index.build([
+        {'idDrink': '1', 'strDrink': 'Gimlet', 'strIngredient1': 'Gin', 'strIngredient2': 'Lime Juice'},
+        {'idDrink': '2', 'strDrink': 'Gin Tonic', 'strIngredient1': 'Gin', 'strIngredient2': 'Tonic Water',
+         'strIngredient3': 'Lime'},
+        {'idDrink': '3', 'strDrink': 'Daiquiri', 'strIngredient1': 'Rum', 'strIngredient2': 'Lime',
+         'strIngredient3': 'Sugar'},
+    ])
+    return index
+
+def ids(drinks):
+    return [drink['idDrink'] for drink in drinks]
+
+def test_parse_ingredient_query():
+    assert parse_ingredient_query('Gin,  Lime') == ['gin', 'lime']
+    assert parse_ingredient_query('gin and lime + sugar') == ['gin', 'lime', 'sugar']
+    assert parse_ingredient_query(', ,') == []
+
+def test_term_matches_ingredients_containing_its_words():
+    ## Equal coverage is ordered by name
+    assert ids(make_index().search(['lime'])) == ['1', '3', '2']
+    assert ids(make_index().search(['LIME  juice'])) == ['1']
+
+def test_all_and_any():
+    index = make_index()
+    assert ids(index.search(['gin', 'lime'])) == ['1', '2']
+    assert ids(index.search(['gin', 'sugar'], match='any')) == ['1', '3', '2']
+
+def test_ranked_by_matches_then_coverage():
+    results = make_index().search(['rum', 'lime'], match='any')
+    assert ids(results) == ['3', '1', '2']
+    assert results[0]['matched'] == 2
+    assert results[1]['coverage'] == 0.5
+
+def test_add_and_remove():
+    index = make_index()
+    index.add({'idDrink': '1', 'strDrink': 'Gimlet', 'strIngredient1': 'Vodka', 'strIngredient2': 'Lime Juice'})
+    assert ids(index.search(['gin'])) == ['2']
+    index.remove('2')
+    assert index.search(['tonic']) == []
+    assert index.search([]) == []
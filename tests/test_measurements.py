@@ -0,0 +1,32 @@
+import pytest
+from measurements import Measure, convert_measure, convert_recipe, parse_measure
+
+@pytest.mark.parametrize('text, expected', [
+    ('1 1/2 oz', Measure(1.5, None, 'oz', '')),
+    ('2-3 cl', Measure(2.0, 3.0, 'cl', '')),
+    ('1 to 2 tsp sugar', Measure(1.0, 2.0, 'tsp', 'sugar')),
+    ('½ fl oz', Measure(0.5, None, 'oz', '')),
+    ('3 Dashes', Measure(3.0, None, 'dash', '')),
+    ('Juice of 1', None),
+    ('to taste', None),
+    (None, None),
+])
+def test_parse_measure(text, expected):
+    assert parse_measure(text) == expected
+
+@pytest.mark.parametrize('text, system, expected', [
+    ('1 1/2 oz', 'metric', '44.36 ml'),
+    ('2-3 cl', 'imperial', '0.68-1.01 oz'),
+    ('1 lb', 'metric', '453.59 ml'),
+    ('2 tsp sugar', 'metric', '9.86 ml sugar'),
+    ('4 cl', 'metric', '4 cl'),
+    ('2 parts', 'metric', '2 parts'),
+    ('Juice of 1', 'metric', 'Juice of 1'),
+])
+def test_convert_measure(text, system, expected):
+    assert convert_measure(text, system) == expected
+
+def test_convert_recipe_leaves_the_original():
+    recipe = {'strDrink': 'Gimlet', 'strMeasure1': '2 oz', 'strMeasure2': None}
+    assert convert_recipe(recipe, 'metric')['strMeasure1'] == '59.15 ml'
+    assert recipe['strMeasure1'] == '2 oz'
@@ -0,0 +1,41 @@
+from name_index import NameIndex
+
+def make_index():
+    index = NameIndex()
+    index.build([
+        {'idDrink': '1', 'strDrink': 'Margarita'},
+        {'idDrink': '2', 'strDrink': 'Mojito'},
+        {'idDrink': '3', 'strDrink': 'Blue Margarita'},
+        {'idDrink': '4', 'strDrink': 'Manhattan'},
+    ])
+    return index
+
+def ids(drinks):
+    return [drink['idDrink'] for drink in drinks]
+
+def test_prefix_in_name_order():
+    assert ids(make_index().prefix('ma')) == ['4', '1']
+
+def test_single_letter_search_is_a_prefix_search():
+    assert ids(make_index().search('M')) == ['4', '1', '2']
+
+def test_substring_ranks_name_then_word_then_other_matches():
+    index = make_index()
+    index.add({'idDrink': '5', 'strDrink': 'Frozen margarita'})
+    index.add({'idDrink': '6', 'strDrink': 'Amargarita'})
+    assert ids(index.search('margarita')) == ['1', '3', '5', '6']
+
+def test_typo_falls_back_to_similar_names():
+    index = make_index()
+    ## Both names have 4 of the 6 3-grams of the query
+    assert ids(index.search('margarta')) == ['3', '1']
+    assert index.search('margarta', fuzzy=False) == []
+
+def test_add_replaces_and_remove_drops():
+    index = make_index()
+    index.add({'idDrink': '2', 'strDrink': 'Mint Julep'})
+    assert ids(index.search('mojito', fuzzy=False)) == []
+    assert ids(index.search('julep')) == ['2']
+    index.remove('4')
+    assert ids(index.prefix('man')) == []
+    assert len(index) == 3
@@ -0,0 +1,43 @@
+import pytest
+from storage import Store
+
+@pytest.fixture
+def store(tmp_path):
+    return Store(str(tmp_path / 'cafecopycat.sqlite'))
+
+def recipe(drink_id, rating=None):
+    return {'idDrink': drink_id, 'strDrink': f'Drink {drink_id}', 'strCategory': 'Cocktail', 'rating': rating}
+
+def test_rating_stats_of_batch_ratings(store):
+    assert store.rating_stats('1') == {'count': 0, 'mean': None}
+    assert store.add_ratings([('1', 5), ('1', 2), ('2', 4)]) == 2
+    assert store.rating_stats('1') == {'count': 2, 'mean': 3.5}
+    assert store.top_rated(limit=1) == [('2', 1, 4.0)]
+
+def test_own_rating_is_moved_not_added(store):
+    store.add_ratings([('1', 1)])
+    store.save_recipe(recipe('1', rating=5), 'saved')
+    assert store.rating_stats('1') == {'count': 2, 'mean': 3.0}
+    assert store.set_rating('1', 3)
+    assert store.rating_stats('1') == {'count': 2, 'mean': 2.0}
+    store.delete_recipe('1')
+    assert store.rating_stats('1') == {'count': 1, 'mean': 1.0}
+
+def test_recipe_changes_since_a_version(store):
+    store.save_recipes([(recipe('1'), 'saved'), (recipe('2'), 'created')])
+    since = store.recipes_version()
+    changed, deleted = store.recipe_changes(since)
+    assert (changed, deleted) == ([], [])
+
+    store.set_notes('1', 'less sugar')
+    store.delete_recipe('2')
+    changed, deleted = store.recipe_changes(since)
+    assert [(kind, record['idDrink'], record['notes']) for kind, record in changed] == [('saved', '1', 'less sugar')]
+    assert deleted == ['2']
+    assert store.recipe_changes(store.recipes_version()) == ([], [])
+
+def test_recipe_changes_from_the_start(store):
+    store.save_recipe(recipe('1', rating=4), 'saved')
+    changed, deleted = store.recipe_changes(None)
+    assert [(kind, record['rating']) for kind, record in changed] == [('saved', 4)]
+    assert deleted == []
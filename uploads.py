@@ -0,0 +1,124 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.utils import secure_filename
+import applog
+
+try:
+    from PIL import Image
+except ImportError:
+    ## Pillow is optional; without it uploads are stored but no thumbnails are made
+    Image = None
+
+## Upload pipeline for recipe images.
+## Werkzeug has already spooled the upload to a temporary file; it is copied from there
+## in chunks while it is hashed, so it is never held in memory as a whole, and stored
+## under its content hash (e.g. 3f2a...e1.jpg), so the same photo is only kept once and two
+## uploads with the same file name no longer overwrite each other. Resized
+## thumbnails are generated on a worker pool after the request has returned.
+
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+THUMBNAIL_SIZES = {'small': 200, 'medium': 400}
+CHUNK_SIZE = 64 * 1024
+
+log = applog.get_logger('uploads')
+
+class UploadError(Exception):
+    pass
+
+class UploadPipeline:
+    def __init__(self, upload_dir, max_bytes=5 * 1024 * 1024, workers=2):
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails')
+        self._lock = threading.Lock()
+        self._ready = set()
+        os.makedirs(upload_dir, exist_ok=True)
+        ## Thumbnails made before a restart are still usable
+        self._ready.update(name for name in os.listdir(upload_dir) if '_' in name and not name.startswith('.'))
+
+    def store(self, file):
+        ## Save an uploaded FileStorage and return the stored file name.
+        ## Raises UploadError if the file is too large or not an image.
+        extension = os.path.splitext(secure_filename(file.filename or ''))[1].lower().lstrip('.')
+        if extension not in ALLOWED_EXTENSIONS:
+            raise UploadError(f"Only {', '.join(sorted(ALLOWED_EXTENSIONS))} images can be uploaded.")
+        if extension == 'jpeg':
+            extension = 'jpg'
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.upload_dir, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = file.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadError(f"Images must be smaller than {self.max_bytes // (1024 * 1024)} MB.")
+                    digest.update(chunk)
+                    out.write(chunk)
+            if size == 0:
+                raise UploadError("The uploaded file is empty.")
+
+            filename = f"{digest.hexdigest()[:32]}.{extension}"
+            path = os.path.join(self.upload_dir, filename)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._executor.submit(self._make_thumbnails, filename)
+        return filename
+
+    def thumbnail_name(self, filename, size):
+        stem, extension = os.path.splitext(filename)
+        return f"{stem}_{size}{extension}"
+
+    def thumbnail_for(self, filename, size='small'):
+        ## Return the thumbnail file name if it has been generated, otherwise None.
+        ## Another worker process may have generated it, so a miss looks on disk; only
+        ## thumbnails that exist are remembered.
+        name = self.thumbnail_name(filename, size)
+        with self._lock:
+            if name in self._ready:
+                return name
+        if not os.path.exists(os.path.join(self.upload_dir, name)):
+            return None
+        with self._lock:
+            self._ready.add(name)
+        return name
+
+    def _make_thumbnails(self, filename):
+        if Image is None:
+            return
+        path = os.path.join(self.upload_dir, filename)
+        try:
+            for size, pixels in THUMBNAIL_SIZES.items():
+                name = self.thumbnail_name(filename, size)
+                thumb_path = os.path.join(self.upload_dir, name)
+                if not os.path.exists(thumb_path):
+                    ## Another worker may be writing the same thumbnail, so each uses its own temp file
+                    fd, tmp_path = tempfile.mkstemp(dir=self.upload_dir, prefix='.thumbnail-')
+                    try:
+                        with os.fdopen(fd, 'wb') as out, Image.open(path) as image:
+                            image_format = image.format
+                            image.thumbnail((pixels, pixels))
+                            image.save(out, format=image_format)
+                        os.replace(tmp_path, thumb_path)
+                    except BaseException:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                        raise
+                with self._lock:
+                    self._ready.add(name)
+        except Exception as e:
+            log.warning('Thumbnail generation failed', filename=filename, error=str(e))
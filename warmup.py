@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+import applog
+
+log = applog.get_logger('warmup')
+
+## Start-up work that runs after the server is already accepting connections.
+## Steps run in order on a background thread. The app is ready once every required
+## step has finished; optional steps (e.g. warming caches from the API) keep running
+## after that and only show up in the status. /ready reports the status so a load
+## balancer can hold traffic back until the worker is warm.
+## A pre-forking server runs the required steps in the master with preload(), so the
+## workers share the loaded catalog; start() in a worker then runs what is left.
+## Threads don't survive a fork, so start() in a forked child starts a new thread.
+
+class Warmup:
+    def __init__(self):
+        self._steps = []
+        self._status = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.created = time.monotonic()
+        self.ready_after = None
+
+    def add(self, name, func, required=True):
+        self._steps.append((name, func, required))
+        self._status[name] = {'state': 'pending', 'required': required}
+
+    def start(self):
+        ## Run the steps on a background thread. Calling start() again in the same process does nothing.
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+        self._thread.start()
+
+    def preload(self, *optional):
+        ## Run the required steps, and the optional ones named, in the calling thread,
+        ## e.g. in a server's master before it forks.
+        self.run(include=optional)
+        return self.ready
+
+    def run(self, include=None):
+        ## With include, optional steps not named in it are left for later.
+        ## Steps that already finished (before a fork, say) are not run again.
+        failed = False
+        for name, func, required in sorted(self._steps, key=lambda step: not step[2]):
+            if self._status[name]['state'] == 'done' or (include is not None and not required and name not in include):
+                continue
+            if failed and required:
+                self._set(name, state='skipped')
+                continue
+            self._set(name, state='running')
+            started = time.perf_counter()
+            try:
+                func()
+            except Exception as e:
+                log.exception('Warmup step failed', step=name, error=str(e))
+                self._set(name, state='failed', error=str(e), seconds=round(time.perf_counter() - started, 3))
+                failed = failed or required
+                continue
+            seconds = round(time.perf_counter() - started, 3)
+            self._set(name, state='done', seconds=seconds)
+            log.info('Warmup step done', step=name, seconds=seconds)
+            if not failed and not self._ready.is_set() and self._required_done():
+                self.ready_after = round(time.monotonic() - self.created, 3)
+                self._ready.set()
+                log.info('Ready', seconds=self.ready_after)
+
+    def _required_done(self):
+        with self._lock:
+            return all(status['state'] == 'done' for status in self._status.values() if status['required'])
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self._status[name].update(fields)
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def status(self):
+        with self._lock:
+            return {'ready': self._ready.is_set(), 'ready_after_seconds': self.ready_after,
+                    'uptime_seconds': round(time.monotonic() - self.created, 3),
+                    'steps': {name: dict(status) for name, status in self._status.items()}}